@@ -555,8 +555,173 @@ function installStyles(theme) {
     document.head.appendChild(linkElementStyles);
 }
 
+function createElem(tag, className, text) {
+    const elem = document.createElement(tag)
+    if (className) {
+        elem.className = className
+    }
+    if (text !== undefined && text !== null) {
+        elem.textContent = text
+    }
+    return elem
+}
+
+function createPreviewImage(record, noPreviewUrl, className) {
+    const image = createElem('img', className)
+    image.alt = 'Preview image'
+    image.onerror = function () {
+        this.onerror = null
+        this.src = noPreviewUrl
+    }
+    image.src = record.preview_url ? record.preview_url : noPreviewUrl
+    return image
+}
+
+function createTypeBadge(record) {
+    return createElem('span', 'mo-badge ' + record.model_type_class, record.model_type)
+}
+
+function appendRecordButtons(container, record) {
+    const buttons = []
+    if (record.is_local) {
+        buttons.push(['Add', 'mo-btn-success', () => navigateEditPrefilled(record.prefilled_json)])
+        buttons.push(['Remove', 'mo-btn-danger', () => navigateRemove(record.location)])
+    } else {
+        buttons.push(['Details', 'mo-btn-success', () => navigateDetails(record.id)])
+        if (record.is_download_possible) {
+            buttons.push(['Download', 'mo-btn-primary', () => navigateDownloadRecord(record.id)])
+        }
+        buttons.push(['Edit', 'mo-btn-warning', () => navigateEdit(record.id)])
+        buttons.push(['Remove', 'mo-btn-danger', () => navigateRemove(record.id)])
+    }
+
+    buttons.forEach(function (item) {
+        const button = createElem('button', 'mo-btn ' + item[1], item[0])
+        button.type = 'button'
+        button.addEventListener('click', item[2])
+        container.appendChild(button)
+        container.appendChild(document.createElement('br'))
+    });
+}
+
+/**
+ * Creates home screen card, must be kept in sync with records_cards in ui_styled_html.py.
+ */
+function createRecordCard(record, noPreviewUrl) {
+    const card = createElem('div', 'mo-card')
+    card.appendChild(createPreviewImage(record, noPreviewUrl))
+    card.appendChild(createElem('div', 'mo-card-blur-overlay-bottom', record.name))
+
+    const top = createElem('div', 'mo-card-content-top')
+    const topLeft = createElem('div', 'mo-card-text-left')
+    topLeft.appendChild(createTypeBadge(record))
+    top.appendChild(topLeft)
+    card.appendChild(top)
+
+    const hover = createElem('div', 'mo-card-hover')
+    const hoverButtons = createElem('div', 'mo-card-hover-buttons')
+    appendRecordButtons(hoverButtons, record)
+    hover.appendChild(hoverButtons)
+    card.appendChild(hover)
+    return card
+}
+
+/**
+ * Creates home screen table row, must be kept in sync with records_table in ui_styled_html.py.
+ */
+function createRecordRow(record, noPreviewUrl) {
+    const row = createElem('div', 'mo-row')
+
+    const previewCol = createElem('div', 'mo-col mo-col-preview')
+    previewCol.appendChild(createPreviewImage(record, noPreviewUrl, 'mo-preview-image'))
+    row.appendChild(previewCol)
+
+    const typeCol = createElem('div', 'mo-col mo-col-type')
+    typeCol.appendChild(createTypeBadge(record))
+    row.appendChild(typeCol)
+
+    const nameCol = createElem('div', 'mo-col mo-col-name')
+    const nameButton = createElem('button', 'mo-button-name', record.name)
+    nameButton.addEventListener('click', () => navigateDetails(record.id))
+    nameCol.appendChild(nameButton)
+    row.appendChild(nameCol)
+
+    const descriptionCol = createElem('div', 'mo-col mo-col-description')
+    descriptionCol.appendChild(createElem('span', 'mo-text-description', record.description))
+    row.appendChild(descriptionCol)
+
+    const actionsCol = createElem('div', 'mo-col mo-col-actions')
+    appendRecordButtons(actionsCol, record)
+    row.appendChild(actionsCol)
+    return row
+}
+
+const loadMoreObserver = new IntersectionObserver((entries) => {
+    entries.forEach(function (entry) {
+        if (entry.isIntersecting) {
+            loadMoreRecords(entry.target)
+        }
+    });
+}, {rootMargin: '600px'});
+
+/**
+ * Loads next page of home screen records when the load more marker gets visible.
+ * @param sentinel - marker element placed after the records list.
+ */
+function loadMoreRecords(sentinel) {
+    if (sentinel.dataset.state === undefined || sentinel.dataset.loading === 'true') {
+        return
+    }
+    sentinel.dataset.loading = 'true'
+
+    const url = origin + '/mo/records?state=' + encodeURIComponent(sentinel.dataset.state) +
+        '&offset=' + sentinel.dataset.offset + '&limit=' + sentinel.dataset.limit
+    fetch(url)
+        .then(response => response.json())
+        .then(data => {
+            const container = sentinel.previousElementSibling
+            const isCards = sentinel.dataset.layout === 'Cards'
+            data.records.forEach(function (record) {
+                if (isCards) {
+                    container.appendChild(createRecordCard(record, sentinel.dataset.noPreview))
+                } else {
+                    container.appendChild(createRecordRow(record, sentinel.dataset.noPreview))
+                }
+            });
+
+            sentinel.dataset.offset = data.offset
+            sentinel.dataset.loading = 'false'
+            loadMoreObserver.unobserve(sentinel)
+            if (data.has_more) {
+                // Observing again reports current intersection, so short pages keep loading.
+                loadMoreObserver.observe(sentinel)
+            } else {
+                sentinel.remove()
+            }
+        })
+        .catch(error => {
+            console.log('Failed to load records page: ' + error)
+            sentinel.dataset.loading = 'false'
+        });
+}
+
+function observeLoadMoreSentinels(root) {
+    root.querySelectorAll('.mo-load-more').forEach(function (sentinel) {
+        if (sentinel.dataset.observed !== 'true') {
+            sentinel.dataset.observed = 'true'
+            loadMoreObserver.observe(sentinel)
+        }
+    });
+}
+
 onUiLoaded(function () {
     log("UI loaded")
+    const homeContent = findElem('mo-home-content')
+    if (homeContent) {
+        const mutationObserver = new MutationObserver(() => observeLoadMoreSentinels(homeContent));
+        mutationObserver.observe(homeContent, {childList: true, subtree: true});
+    }
+
     const homeTab = findElem('mo_home_tab')
     const intersectionObserver = new IntersectionObserver((entries) => {
         if (entries[0].intersectionRatio > 0) invokeHomeInitialStateLoad();
@@ -1,8 +1,64 @@
+import json
 import os
+from typing import Callable, Optional
 
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request
+from starlette.responses import FileResponse, JSONResponse, Response
 
+import scripts.mo.ui_styled_html as styled
+from scripts.mo.data.file_watcher import FileWatcher
+from scripts.mo.data.record_utils import load_records_and_filter
+from scripts.mo.data.storage import map_record_to_dict
 from scripts.mo.environment import logger, env
+from scripts.mo.thumbnails import get_thumbnail_key, get_thumbnail
+
+_MAX_PAGE_SIZE = 500
+# Thumbnail and preview links contain preview mtime, and thumbnail links the card size, so the same link always
+# refers to the same image.
+_THUMBNAIL_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def _check_preview_filename(filename: str):
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in (".png", ".jpg", ".jpeg", ".webp"):
+        raise ValueError(f"File cannot be fetched: {filename}. Only png and jpg and jpeg and webp.")
+
+
+def _get_etag() -> Optional[str]:
+    """
+    Creates ETag for records responses from storage change token, local files inventory generation and card size,
+    which is a part of thumbnail links.
+    :return: ETag string or None if storage changes can't be tracked.
+    """
+    change_token = env.storage.get_change_token()
+    if change_token is None:
+        return None
+    return f'"{change_token}-{FileWatcher.instance().generation}-{env.card_width()}x{env.card_height()}"'
+
+
+def _is_not_modified(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get('if-none-match')
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or etag in tags or f'W/{etag}' in tags
+
+
+def _conditional_response(request: Request, create_content: Callable) -> Response:
+    """
+    Creates JSON response with ETag header, content isn't created at all if client has the same version cached.
+    :param request: incoming request.
+    :param create_content: function that returns JSON content.
+    :return: JSON response or 304 response.
+    """
+    etag = _get_etag()
+    if etag is None:
+        return JSONResponse(create_content())
+
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if _is_not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(create_content(), headers=headers)
 
 
 def init_extension_api(app: FastAPI):
@@ -14,14 +70,61 @@ def init_extension_api(app: FastAPI):
             'theme': env.theme()
         }
 
+    @app.get('/mo/records')
+    def get_records(request: Request, state: str, offset: int = 0, limit: int = 50):
+        limit = max(1, min(limit, _MAX_PAGE_SIZE))
+        offset = max(0, offset)
+
+        def create_content():
+            records = load_records_and_filter(json.loads(state), True, limit + 1, offset)
+            return {
+                'records': [styled.record_view_dict(record) for record in records[:limit]],
+                'offset': offset + min(len(records), limit),
+                'has_more': len(records) > limit
+            }
+
+        return _conditional_response(request, create_content)
+
+    @app.get('/mo/records/{record_id}')
+    def get_record(request: Request, record_id: str):
+        def create_content():
+            record = env.storage.get_record_by_id(record_id)
+            if record is None:
+                raise HTTPException(status_code=404, detail=f'Record not found: {record_id}')
+            content = map_record_to_dict(record)
+            content['is_downloaded'] = record.is_file_exists()
+            return content
+
+        return _conditional_response(request, create_content)
+
+    @app.get('/mo/groups')
+    def get_groups(request: Request):
+        return _conditional_response(request, lambda: sorted(env.storage.get_available_groups(), key=str.lower))
+
     @app.get('/mo/thumbnail')
-    async def get_thumbnail_file(filename: str = ""):
-        from starlette.responses import FileResponse
+    def get_thumbnail_file(request: Request, filename: str = ""):
+        _check_preview_filename(filename)
+
+        key = get_thumbnail_key(filename)
+        if key is None:
+            raise HTTPException(status_code=404, detail=f'File not found: {filename}')
+
+        etag = f'"{key}"'
+        headers = {'ETag': etag, 'Cache-Control': _THUMBNAIL_CACHE_CONTROL}
+        if _is_not_modified(request, etag):
+            return Response(status_code=304, headers=headers)
 
-        ext = os.path.splitext(filename)[1].lower()
-        if ext not in (".png", ".jpg", ".jpeg", ".webp"):
-            raise ValueError(f"File cannot be fetched: {filename}. Only png and jpg and jpeg and webp.")
+        thumbnail = get_thumbnail(filename, key)
+        if thumbnail is None:
+            # Image that Pillow can't read is still given to the browser as is.
+            return FileResponse(filename, headers={"Accept-Ranges": "bytes"})
+        return FileResponse(thumbnail[0], media_type='image/webp', headers=headers)
 
-        return FileResponse(filename, headers={"Accept-Ranges": "bytes"})
+    @app.get('/mo/preview')
+    def get_preview_file(filename: str = ""):
+        _check_preview_filename(filename)
+        if not os.path.isfile(filename):
+            raise HTTPException(status_code=404, detail=f'File not found: {filename}')
+        return FileResponse(filename, headers={"Accept-Ranges": "bytes", 'Cache-Control': _THUMBNAIL_CACHE_CONTROL})
 
     logger.debug('Model Organizer API initialized')
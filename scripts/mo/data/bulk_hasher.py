@@ -0,0 +1,117 @@
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import List
+
+from scripts.mo.data.hash_index import HashIndex
+from scripts.mo.data.hash_worker import hash_file
+from scripts.mo.environment import logger
+
+_INDEX_BATCH_SIZE = 20
+
+
+class BulkHasher:
+    """
+    Hashes many files at once in a pool of worker processes and saves results into the HashIndex. Files that were not
+    changed since the last hashing are taken from the index. Largest files are scheduled first, so the pool is not left
+    waiting for a single big checkpoint at the end.
+    """
+
+    def __init__(self, max_workers=None):
+        self._max_workers = max_workers if max_workers else max(1, os.cpu_count() or 1)
+
+    def hash_files(self, paths: List, stop_event: threading.Event):
+        """
+        Hashes files and yields progress updates. The last update contains 'results' list.
+        :param paths: files paths to hash.
+        :param stop_event: event to cancel hashing, files hashed before cancellation are kept in the index.
+        :return: generator of progress dictionaries.
+        """
+        start_time = time.time()
+        index = HashIndex.instance()
+        cached = index.lookup_many(paths)
+
+        results = []
+        pending = []
+        for path in paths:
+            entry = cached.get(path)
+            if entry is not None:
+                results.append({'path': path, 'sha256': entry['sha256'], 'md5': entry['md5'], 'cached': True})
+                continue
+            try:
+                pending.append((path, os.stat(path)))
+            except OSError as ex:
+                logger.warning(f'Failed to stat {path}: {ex}')
+
+        pending.sort(key=lambda item: item[1].st_size, reverse=True)
+
+        progress = {
+            'files_total': len(results) + len(pending),
+            'files_done': len(results),
+            'bytes_total': sum(stat_result.st_size for _, stat_result in pending),
+            'bytes_done': 0,
+            'elapsed': 0
+        }
+        yield dict(progress)
+
+        if pending and not stop_event.is_set():
+            try:
+                yield from self._run_pool(ProcessPoolExecutor, pending, results, progress, stop_event, start_time)
+            except (BrokenProcessPool, OSError) as ex:
+                # Worker processes can't be started in some environments, hashlib releases the GIL for large
+                # blocks, so threads still run hashing in parallel.
+                logger.warning(f'Process pool hashing failed, fallback to threads: {ex}')
+                hashed = {result['path'] for result in results}
+                pending = [item for item in pending if item[0] not in hashed]
+                yield from self._run_pool(ThreadPoolExecutor, pending, results, progress, stop_event, start_time)
+
+        progress['elapsed'] = time.time() - start_time
+        progress['cancelled'] = stop_event.is_set()
+        progress['results'] = results
+        yield progress
+
+    def _run_pool(self, executor_type, pending: List, results: List, progress: dict, stop_event: threading.Event,
+                  start_time: float):
+        index = HashIndex.instance()
+        stats = dict(pending)
+        queue = list(pending)
+        index_batch = []
+
+        executor = executor_type(max_workers=self._max_workers)
+        try:
+            running = {}
+            while (queue or running) and not stop_event.is_set():
+                # Keep a bounded number of submitted files, so cancellation doesn't wait for the whole library.
+                while queue and len(running) < self._max_workers * 2:
+                    path, _ = queue.pop(0)
+                    running[executor.submit(hash_file, path)] = path
+
+                done, _ = wait(running.keys(), timeout=0.5, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path = running.pop(future)
+                    try:
+                        _, sha256, md5 = future.result()
+                    except BrokenProcessPool:
+                        raise
+                    except OSError as ex:
+                        logger.warning(f'Failed to hash file {path}: {ex}')
+                        continue
+
+                    stat_result = stats[path]
+                    index_batch.append((path, sha256, md5, stat_result))
+                    results.append({'path': path, 'sha256': sha256, 'md5': md5, 'cached': False})
+                    progress['files_done'] += 1
+                    progress['bytes_done'] += stat_result.st_size
+
+                if len(index_batch) >= _INDEX_BATCH_SIZE:
+                    index.put_many(index_batch)
+                    index_batch = []
+
+                progress['elapsed'] = time.time() - start_time
+                yield dict(progress)
+        finally:
+            if index_batch:
+                index.put_many(index_batch)
+            executor.shutdown(wait=not stop_event.is_set(), cancel_futures=True)
@@ -0,0 +1,162 @@
+import copy
+import threading
+import time
+from typing import Dict, List, Optional
+
+from scripts.mo.data.storage import Storage
+from scripts.mo.environment import logger
+from scripts.mo.models import Record, ModelSort
+
+
+def _copy_record(record: Record) -> Record:
+    # Callers modify returned records before update_record, so cached instances are never given out.
+    result = copy.copy(record)
+    result.groups = list(record.groups)
+    return result
+
+
+class _RecordsIndex:
+    def __init__(self, records: List):
+        self.by_id: Dict = {}
+        self.by_group: Dict = {}
+        self.group_names: Dict = {}
+
+        for record in records:
+            self.by_id[record.id_] = record
+            for group in record.groups:
+                if not group:
+                    continue
+                key = group.lower()
+                self.group_names.setdefault(key, group)
+                self.by_group.setdefault(key, {})[record.id_] = record
+
+
+class CachedStorage(Storage):
+    """
+    Keeps all records of the wrapped storage in memory, indexed by id and group, for lookups of single records, groups
+    and locations. Used for Firebase storage with the local mirror, SQLite storage answers these lookups from its own
+    indexes faster than the cache is reloaded. Cache is dropped on every write made through this storage, and reloaded when the wrapped storage
+    change token differs from the one the cache was loaded with. Storages that can't report changes made by other
+    clients are not cached at all. Queries are always passed to the wrapped storage, which filters, orders and pages
+    records itself and knows the stored files state.
+    """
+
+    def __init__(self, storage: Storage):
+        self._storage = storage
+        self._lock = threading.RLock()
+        self._index: Optional[_RecordsIndex] = None
+        self._index_token = None
+
+    def invalidate(self):
+        with self._lock:
+            self._index = None
+
+    def _get_index(self) -> Optional[_RecordsIndex]:
+        """
+        Returns records index, index is loaded again if the wrapped storage was changed.
+        :return: records index or None if the wrapped storage can't report changes.
+        """
+        with self._lock:
+            token = self._storage.get_change_token()
+            if token is None:
+                self._index = None
+                return None
+            if self._index is None or token != self._index_token:
+                # Token is taken before records, so changes made while loading cause one more reload.
+                started = time.time()
+                self._index = _RecordsIndex(self._storage.get_all_records())
+                self._index_token = token
+                logger.debug(f'Records cache loaded: {len(self._index.by_id)} records in {time.time() - started:.3f}s')
+            return self._index
+
+    def get_all_records(self) -> List:
+        index = self._get_index()
+        if index is None:
+            return self._storage.get_all_records()
+        return [_copy_record(record) for record in index.by_id.values()]
+
+    def query_records(self, name_query=None, groups=None, model_types=None, show_downloaded=True,
+                      show_not_downloaded=True, full_text=False, sort_order: Optional[ModelSort] = None,
+                      sort_downloaded_first=False, limit: Optional[int] = None, offset=0) -> List:
+        return self._storage.query_records(name_query=name_query, groups=groups, model_types=model_types,
+                                           show_downloaded=show_downloaded, show_not_downloaded=show_not_downloaded,
+                                           full_text=full_text, sort_order=sort_order,
+                                           sort_downloaded_first=sort_downloaded_first, limit=limit, offset=offset)
+
+    def get_record_by_id(self, _id) -> Record:
+        index = self._get_index()
+        if index is None:
+            return self._storage.get_record_by_id(_id)
+        record = index.by_id.get(_id)
+        if record is None and isinstance(_id, str) and _id.isdigit():
+            # SQLite ids are integers, while UI passes them as strings.
+            record = index.by_id.get(int(_id))
+        if record is None:
+            return None
+        result = _copy_record(record)
+        # Cached state could be outdated, the same as the stored one, so the file is checked on demand.
+        result.downloaded = None
+        return result
+
+    def add_record(self, record: Record):
+        try:
+            self._storage.add_record(record)
+        finally:
+            self.invalidate()
+
+    def add_records(self, records: List):
+        try:
+            self._storage.add_records(records)
+        finally:
+            self.invalidate()
+
+    def update_record(self, record: Record):
+        try:
+            self._storage.update_record(record)
+        finally:
+            self.invalidate()
+
+    def update_records(self, records: List):
+        try:
+            self._storage.update_records(records)
+        finally:
+            self.invalidate()
+
+    def remove_record(self, _id):
+        try:
+            self._storage.remove_record(_id)
+        finally:
+            self.invalidate()
+
+    def remove_records(self, ids: List):
+        try:
+            self._storage.remove_records(ids)
+        finally:
+            self.invalidate()
+
+    def get_available_groups(self) -> List:
+        index = self._get_index()
+        if index is None:
+            return self._storage.get_available_groups()
+        return list(index.group_names.values())
+
+    def get_records_by_group(self, group: str) -> List:
+        index = self._get_index()
+        if index is None:
+            return self._storage.get_records_by_group(group)
+        return [_copy_record(record) for record in index.by_group.get(group.lower(), {}).values()]
+
+    def get_all_records_locations(self) -> List:
+        index = self._get_index()
+        if index is None:
+            return self._storage.get_all_records_locations()
+        return list(set(record.location for record in index.by_id.values() if record.location))
+
+    def update_files_state(self, locations: List):
+        self._storage.update_files_state(locations)
+
+    def refresh_files_state(self):
+        self._storage.refresh_files_state()
+
+    def get_change_token(self) -> Optional[str]:
+        return self._storage.get_change_token()
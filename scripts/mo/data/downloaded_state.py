@@ -0,0 +1,42 @@
+import os
+from typing import List
+
+from scripts.mo.data.local_scanner import LocalScanner
+
+
+def resolve_downloaded_state(records: List) -> List:
+    """
+    Resolves whether records files exist for the whole records list at once. Locations are grouped by directory, and
+    every directory is listed once through the LocalScanner instead of a stat call per record. Result is stored in the
+    record.downloaded field, which is used by Record.is_file_exists.
+    :param records: records to resolve state for.
+    :return: the same records list.
+    """
+    by_dir = {}
+    for record in records:
+        if record.location:
+            by_dir.setdefault(os.path.dirname(record.location), []).append(record)
+        else:
+            record.downloaded = False
+
+    scanner = LocalScanner.instance()
+    for dir_path, dir_records in by_dir.items():
+        listing = scanner.list_dir(dir_path if dir_path else os.curdir)
+        files = set() if listing is None else set(listing.files)
+        for record in dir_records:
+            record.downloaded = os.path.basename(record.location) in files
+
+    return records
+
+
+def filter_by_downloaded_state(records: List, show_downloaded, show_not_downloaded) -> List:
+    """
+    Filters records by downloaded state, state is resolved for all records in a single pass.
+    :param records: records to filter.
+    :param show_downloaded: keep records with existing files.
+    :param show_not_downloaded: keep records without files.
+    :return: filtered records list.
+    """
+    resolve_downloaded_state(records)
+    return [record for record in records
+            if (show_downloaded and record.downloaded) or (show_not_downloaded and not record.downloaded)]
@@ -0,0 +1,355 @@
+import os
+import threading
+from typing import Callable, List, Optional
+
+from scripts.mo.data.local_scanner import LocalScanner
+from scripts.mo.environment import env, logger
+from scripts.mo.models import ModelType
+from scripts.mo.utils import MODEL_EXTENSIONS, PREVIEW_EXTENSIONS, INFO_EXTENSIONS, \
+    get_model_filename_without_extension
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    FileSystemEventHandler = object
+    Observer = None
+
+FILE_KIND_MODEL = 'model'
+FILE_KIND_PREVIEW = 'preview'
+FILE_KIND_INFO = 'info'
+
+EVENT_CREATED = 'created'
+EVENT_DELETED = 'deleted'
+
+_WATCHED_MODEL_TYPES = [ModelType.CHECKPOINT, ModelType.VAE, ModelType.LORA, ModelType.HYPER_NETWORK,
+                        ModelType.EMBEDDING, ModelType.LYCORIS]
+
+_POLL_INTERVAL = 5
+# inotify doesn't report changes made on other hosts of network mounts, so directories are still rescanned from time
+# to time when watchdog is used.
+_WATCHDOG_POLL_INTERVAL = 60
+
+
+def _get_file_kind(path: str) -> Optional[str]:
+    ext = os.path.splitext(path)[-1].lower()
+    if ext in MODEL_EXTENSIONS:
+        return FILE_KIND_MODEL
+    elif ext in PREVIEW_EXTENSIONS:
+        return FILE_KIND_PREVIEW
+    elif ext in INFO_EXTENSIONS:
+        return FILE_KIND_INFO
+    return None
+
+
+class _Inventory:
+    def __init__(self, root_dir: str):
+        self.root_dir = root_dir
+        self.files = {
+            FILE_KIND_MODEL: {},
+            FILE_KIND_PREVIEW: {},
+            FILE_KIND_INFO: {}
+        }
+
+    def contains(self, path: str) -> bool:
+        kind = _get_file_kind(path)
+        return kind is not None and path in self.files[kind]
+
+
+class _WatchdogHandler(FileSystemEventHandler):
+    def __init__(self, watcher, model_type: ModelType):
+        super().__init__()
+        self._watcher = watcher
+        self._model_type = model_type
+
+    def on_any_event(self, event):
+        if event.is_directory:
+            self._watcher.request_rescan(self._model_type)
+            return
+
+        if event.event_type in ('created', 'deleted'):
+            self._watcher.refresh_path(event.src_path)
+        elif event.event_type == 'moved':
+            self._watcher.refresh_path(event.src_path)
+            self._watcher.refresh_path(event.dest_path)
+
+
+class FileWatcher:
+    """
+    Keeps in-memory inventory of model, preview and info files in the model directories. Inventory is updated from
+    filesystem events when watchdog is installed, directories are polled through the LocalScanner otherwise.
+    Listeners receive lists of event dictionaries with 'event', 'kind', 'path' and 'model_type' keys.
+    """
+    __instance = None
+    __lock = threading.Lock()
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._condition = threading.Condition(self._lock)
+        self._inventories = {}
+        self._rescan_requests = set()
+        self._listeners = []
+        self._observer = None
+        self._thread = None
+        self._ready = threading.Event()
+        self.generation = 0
+
+    @staticmethod
+    def instance():
+        if FileWatcher.__instance is None:
+            with FileWatcher.__lock:
+                if FileWatcher.__instance is None:
+                    FileWatcher.__instance = FileWatcher()
+        return FileWatcher.__instance
+
+    def start(self):
+        """
+        Starts the background watcher thread, which scans model directories first. Does nothing if watcher is already
+        running.
+        :return: None
+        """
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='mo-file-watcher', daemon=True)
+            self._thread.start()
+
+    def wait_ready(self):
+        """
+        Starts the watcher if needed and waits for the initial directories scan.
+        :return: None
+        """
+        self.start()
+        self._ready.wait()
+
+    def add_listener(self, listener: Callable):
+        with self._lock:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable):
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def get_model_files(self, model_type: ModelType) -> List:
+        """
+        Returns model files found in the model type directory and subdirectories.
+        :param model_type: model type to return files for.
+        :return: list of model files paths.
+        """
+        self.wait_ready()
+        with self._lock:
+            inventory = self._inventories.get(model_type)
+            if inventory is None:
+                return []
+            return list(inventory.files[FILE_KIND_MODEL].keys())
+
+    def get_all_model_files(self) -> List:
+        result = []
+        for model_type in _WATCHED_MODEL_TYPES:
+            result.extend(self.get_model_files(model_type))
+        return result
+
+    def get_preview_files(self) -> List:
+        """
+        Returns preview images found in all model directories.
+        :return: list of preview files paths.
+        """
+        self.wait_ready()
+        with self._lock:
+            return [path for inventory in self._inventories.values() for path in inventory.files[FILE_KIND_PREVIEW]]
+
+    def find_preview_file(self, model_file_path: str) -> Optional[str]:
+        """
+        Looks for model image preview in the inventory, same preview names as in utils.find_preview_file are checked.
+        :param model_file_path: path to model file.
+        :return: path to model image preview if it exists, None otherwise.
+        """
+        if not model_file_path:
+            return None
+        path = os.path.join(os.path.dirname(model_file_path), get_model_filename_without_extension(model_file_path))
+        potential_files = sum([[path + ext, path + ".preview" + ext] for ext in PREVIEW_EXTENSIONS], [])
+        return self._find_first(model_file_path, potential_files)
+
+    def find_info_file(self, model_file_path: str) -> Optional[str]:
+        """
+        Looks for model info file in the inventory, same info file names as in utils.find_info_file are checked.
+        :param model_file_path: path to model file.
+        :return: path to model info file if exists, None otherwise.
+        """
+        if not model_file_path:
+            return None
+        path = os.path.join(os.path.dirname(model_file_path), get_model_filename_without_extension(model_file_path))
+        potential_files = [path + ext for ext in INFO_EXTENSIONS]
+        return self._find_first(model_file_path, potential_files)
+
+    def refresh_path(self, path: str):
+        """
+        Updates inventory entry of a single file, used for filesystem events and by the code that writes or removes
+        model files itself.
+        :param path: file path.
+        :return: None
+        """
+        kind = _get_file_kind(path)
+        if kind is None:
+            return
+
+        events = []
+        with self._lock:
+            for model_type, inventory in self._inventories.items():
+                if not path.startswith(inventory.root_dir):
+                    continue
+                exists = os.path.isfile(path)
+                files = inventory.files[kind]
+                if exists and path not in files:
+                    files[path] = True
+                    events.append(self._create_event(EVENT_CREATED, kind, path, model_type))
+                elif not exists and path in files:
+                    del files[path]
+                    events.append(self._create_event(EVENT_DELETED, kind, path, model_type))
+            if events:
+                self.generation += 1
+        self._publish(events)
+
+    def request_rescan(self, model_type: ModelType):
+        with self._lock:
+            self._rescan_requests.add(model_type)
+            self._condition.notify_all()
+
+    def _find_first(self, model_file_path: str, potential_files: List) -> Optional[str]:
+        self.wait_ready()
+        with self._lock:
+            inventory = self._get_inventory_for_path(model_file_path)
+            if inventory is not None:
+                for file in potential_files:
+                    if inventory.contains(file):
+                        return file
+                return None
+
+        # Records might be bound to files outside the model directories.
+        for file in potential_files:
+            if os.path.isfile(file):
+                return file
+        return None
+
+    def _get_inventory_for_path(self, path: str) -> Optional[_Inventory]:
+        for inventory in self._inventories.values():
+            if path.startswith(inventory.root_dir):
+                return inventory
+        return None
+
+    def _run(self):
+        try:
+            self._sync_roots()
+        except Exception as ex:
+            logger.exception(ex)
+        finally:
+            self._ready.set()
+
+        while True:
+            with self._condition:
+                interval = _POLL_INTERVAL if self._observer is None else _WATCHDOG_POLL_INTERVAL
+                if not self._rescan_requests:
+                    self._condition.wait(interval)
+                requested = self._rescan_requests
+                self._rescan_requests = set()
+
+            try:
+                if not self._sync_roots():
+                    model_types = requested if requested else _WATCHED_MODEL_TYPES
+                    for model_type in model_types:
+                        self._rescan(model_type)
+            except Exception as ex:
+                logger.exception(ex)
+
+    def _sync_roots(self) -> bool:
+        """
+        Rebuilds inventories when model directories were changed in settings.
+        :return: True if inventories were rebuilt.
+        """
+        roots = {model_type: os.path.join(env.get_model_path(model_type), '') for model_type in _WATCHED_MODEL_TYPES}
+        with self._lock:
+            current = {model_type: inventory.root_dir for model_type, inventory in self._inventories.items()}
+            if current == roots:
+                return False
+            self._inventories = {model_type: _Inventory(root_dir) for model_type, root_dir in roots.items()}
+
+        for model_type in _WATCHED_MODEL_TYPES:
+            self._rescan(model_type)
+        self._schedule_observer(roots)
+        return True
+
+    def _schedule_observer(self, roots: dict):
+        if Observer is None:
+            return
+
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer = None
+
+        observer = Observer()
+        for model_type, root_dir in roots.items():
+            if os.path.isdir(root_dir):
+                try:
+                    observer.schedule(_WatchdogHandler(self, model_type), root_dir, recursive=True)
+                except OSError as ex:
+                    logger.warning(f'Failed to watch {root_dir}: {ex}')
+        try:
+            observer.start()
+            self._observer = observer
+        except OSError as ex:
+            logger.warning(f'Failed to start filesystem observer, fallback to polling: {ex}')
+
+    def _rescan(self, model_type: ModelType):
+        with self._lock:
+            inventory = self._inventories.get(model_type)
+            if inventory is None:
+                return
+            root_dir = inventory.root_dir
+
+        scanned = {
+            FILE_KIND_MODEL: {},
+            FILE_KIND_PREVIEW: {},
+            FILE_KIND_INFO: {}
+        }
+        for dir_path, _, files in LocalScanner.instance().walk(root_dir):
+            for file in files:
+                kind = _get_file_kind(file)
+                if kind is not None:
+                    scanned[kind][os.path.join(dir_path, file)] = True
+
+        events = []
+        with self._lock:
+            if self._inventories.get(model_type) is not inventory:
+                return
+            for kind, files in scanned.items():
+                previous = inventory.files[kind]
+                for path in files.keys() - previous.keys():
+                    events.append(self._create_event(EVENT_CREATED, kind, path, model_type))
+                for path in previous.keys() - files.keys():
+                    events.append(self._create_event(EVENT_DELETED, kind, path, model_type))
+                inventory.files[kind] = files
+            if events:
+                self.generation += 1
+        self._publish(events)
+
+    @staticmethod
+    def _create_event(event: str, kind: str, path: str, model_type: ModelType) -> dict:
+        return {
+            'event': event,
+            'kind': kind,
+            'path': path,
+            'model_type': model_type
+        }
+
+    def _publish(self, events: List):
+        if not events:
+            return
+
+        with self._lock:
+            listeners = list(self._listeners)
+        for listener in listeners:
+            try:
+                listener(events)
+            except Exception as ex:
+                logger.exception(ex)
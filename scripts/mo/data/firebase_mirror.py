@@ -0,0 +1,128 @@
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, Optional
+
+from scripts.mo.environment import env, logger
+
+_MIRROR_FILE = 'firebase_mirror.sqlite'
+# Time to wait for the first snapshot when there is no local copy yet.
+_INITIAL_SYNC_TIMEOUT = 60
+
+
+class FirebaseMirror:
+    """
+    Local copy of the Firestore records collection. Copy is loaded from the SQLite file on start, so records are
+    available before Firestore responds, and then kept current by the collection snapshot listener. Documents are kept
+    as dictionaries in the same format as Firestore stores them.
+    """
+
+    def __init__(self, collection_ref):
+        self._collection_ref = collection_ref
+        self._lock = threading.Lock()
+        self._synced = threading.Event()
+        self._documents: Dict = {}
+        self._watch = None
+        self.version = 0
+
+        self._connection = sqlite3.connect(os.path.join(env.script_dir, _MIRROR_FILE), check_same_thread=False)
+        self._connection.execute('CREATE TABLE IF NOT EXISTS MirrorDocument(id TEXT PRIMARY KEY, data TEXT)')
+        self._connection.commit()
+        self._load()
+
+    def _load(self):
+        cursor = self._connection.cursor()
+        cursor.execute('SELECT id, data FROM MirrorDocument')
+        for row in cursor.fetchall():
+            self._documents[row[0]] = json.loads(row[1])
+        logger.info(f'Firebase mirror loaded {len(self._documents)} records from the local copy')
+
+    def start(self):
+        """
+        Subscribes to the collection changes, the first snapshot replaces the local copy entirely.
+        :return: None
+        """
+        self._watch = self._collection_ref.on_snapshot(self._on_snapshot)
+
+    def stop(self):
+        if self._watch is not None:
+            self._watch.unsubscribe()
+            self._watch = None
+
+    def get_documents(self) -> Dict:
+        """
+        Returns mirrored documents. Waits for Firestore only when there is no local copy yet.
+        :return: dictionary of documents by id.
+        """
+        if not self._synced.is_set() and not self._documents:
+            if not self._synced.wait(_INITIAL_SYNC_TIMEOUT):
+                logger.warning('Firebase mirror has not received records from Firestore yet')
+        with self._lock:
+            return dict(self._documents)
+
+    def get_document(self, id_) -> Optional[Dict]:
+        with self._lock:
+            return self._documents.get(id_)
+
+    def put(self, id_, data: Dict):
+        """
+        Applies write made by this client without waiting for the listener, which confirms it later.
+        :param id_: document id.
+        :param data: document data.
+        :return: None
+        """
+        self._apply({id_: data}, [])
+
+    def put_all(self, documents: Dict):
+        self._apply(documents, [])
+
+    def delete(self, id_):
+        self._apply({}, [id_])
+
+    def delete_all(self, ids: list):
+        self._apply({}, list(ids))
+
+    def _on_snapshot(self, collection_snapshot, changes, read_time):
+        try:
+            if not self._synced.is_set():
+                documents = {snapshot.id: snapshot.to_dict() for snapshot in collection_snapshot}
+                self._replace(documents)
+                self._synced.set()
+                logger.info(f'Firebase mirror synced {len(documents)} records')
+                return
+
+            updated = {}
+            removed = []
+            for change in changes:
+                if change.type.name == 'REMOVED':
+                    removed.append(change.document.id)
+                else:
+                    updated[change.document.id] = change.document.to_dict()
+            self._apply(updated, removed)
+        except Exception as ex:
+            logger.exception(ex)
+
+    def _replace(self, documents: Dict):
+        with self._lock:
+            self._documents = documents
+            self._connection.execute('DELETE FROM MirrorDocument')
+            self._connection.executemany('INSERT INTO MirrorDocument(id, data) VALUES (?, ?)',
+                                         [(id_, json.dumps(data, default=str)) for id_, data in documents.items()])
+            self._connection.commit()
+            self.version += 1
+
+    def _apply(self, updated: Dict, removed: list):
+        if not updated and not removed:
+            return
+
+        with self._lock:
+            for id_, data in updated.items():
+                self._documents[id_] = data
+            for id_ in removed:
+                self._documents.pop(id_, None)
+            self._connection.executemany('INSERT OR REPLACE INTO MirrorDocument(id, data) VALUES (?, ?)',
+                                         [(id_, json.dumps(data, default=str)) for id_, data in updated.items()])
+            self._connection.executemany('DELETE FROM MirrorDocument WHERE id=?', [(id_,) for id_ in removed])
+            self._connection.commit()
+            self.version += 1
@@ -1,32 +1,117 @@
 import os.path
-from typing import List
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
 
 import firebase_admin
 from firebase_admin import credentials
 from firebase_admin import firestore
 from google.cloud.firestore_v1 import CollectionReference
 
-from scripts.mo.data.storage import Storage, map_dict_to_record, map_record_to_dict
+from scripts.mo.data.downloaded_state import filter_by_downloaded_state
+from scripts.mo.data.firebase_mirror import FirebaseMirror
+from scripts.mo.data.storage import Storage, map_dict_to_record, map_record_to_dict, sort_records, slice_records
 from scripts.mo.environment import env
-from scripts.mo.models import Record
+from scripts.mo.models import Record, ModelSort, ModelType
 
+# Fields that are enough to filter and sort records, the rest is downloaded only for the requested page.
+_FILTER_FIELDS = ['name', 'model_type', 'groups', 'location', 'created_at']
+_MAX_PAGE_CURSORS = 100
+# Firestore limit of writes in a single batch.
+_MAX_BATCH_SIZE = 500
 
-def _filter_download(record: Record, show_downloaded, show_not_downloaded):
-    is_downloaded = bool(record.location) and os.path.exists(record.location)
-    return (show_downloaded and is_downloaded) or (show_not_downloaded and not is_downloaded)
+
+def _search_rank(record: Record, tokens: List) -> int:
+    """
+    Calculates record relevance for the full-text search, every token must be found in one of searchable fields.
+    :param record: record to rank.
+    :param tokens: lower case search tokens.
+    :return: rank, greater is better, 0 if record doesn't match.
+    """
+    fields = [
+        (record.name.lower(), 10),
+        (record.description.lower(), 1),
+        (record.positive_prompts.lower(), 2),
+        (record.negative_prompts.lower(), 1),
+        (','.join(record.groups).lower(), 5)
+    ]
+    rank = 0
+    for token in tokens:
+        token_rank = sum(weight for value, weight in fields if token in value)
+        if token_rank == 0:
+            return 0
+        rank += token_rank
+    return rank
+
+
+def _map_filter_fields(ref) -> Record:
+    raw = ref.to_dict()
+    return Record(
+        id_=ref.id,
+        name=raw.get('name', ''),
+        model_type=ModelType.by_value(raw['model_type']),
+        groups=raw.get('groups', []),
+        location=raw.get('location', ''),
+        created_at=raw.get('created_at', 0)
+    )
 
 
 class FirebaseStorage(Storage):
+    """
+    Records stored in the Firestore 'records' collection. Without the local mirror the storage can't report changes, so
+    it isn't wrapped by CachedStorage and every read below goes to Firestore, filtered and projected on the server as
+    far as Firestore allows.
+    """
 
     def __init__(self):
         cred = credentials.Certificate(os.path.join(env.script_dir, "service-account-file.json"))
         self.app = firebase_admin.initialize_app(cred)
         self.firestore_client = firestore.client()
+        # Last documents of served pages by direction and offset of the next page. Firestore bills and reads every
+        # document skipped by offset(), so the next page continues from the cursor instead.
+        self._page_cursors = OrderedDict()
+        self._page_cursors_lock = threading.Lock()
+
+        self._session = time.time_ns()
+        self._mirror = None
+        if env.firebase_mirror():
+            self._mirror = FirebaseMirror(self._records())
+            self._mirror.start()
 
     def _records(self) -> CollectionReference:
         return self.firestore_client.collection('records')
 
+    def _get_page_cursor(self, direction, offset):
+        with self._page_cursors_lock:
+            return self._page_cursors.get((direction, offset))
+
+    def _put_page_cursor(self, direction, offset, snapshot):
+        with self._page_cursors_lock:
+            self._page_cursors[(direction, offset)] = snapshot
+            while len(self._page_cursors) > _MAX_PAGE_CURSORS:
+                self._page_cursors.popitem(last=False)
+
+    def _clear_page_cursors(self):
+        with self._page_cursors_lock:
+            self._page_cursors.clear()
+
+    def _get_records_by_ids(self, ids: List) -> List:
+        refs = [self._records().document(id_) for id_ in ids]
+        records = {}
+        for snapshot in self.firestore_client.get_all(refs):
+            if snapshot.exists:
+                records[snapshot.id] = map_dict_to_record(snapshot.id, snapshot.to_dict())
+        return [records[id_] for id_ in ids if id_ in records]
+
+    def _get_mirror_records(self) -> List:
+        return [map_dict_to_record(id_, data) for id_, data in self._mirror.get_documents().items()]
+
     def get_all_records(self) -> List:
+        if self._mirror is not None:
+            return self._get_mirror_records()
+
         record_refs = self._records().stream()
         records = []
         for ref in record_refs:
@@ -34,52 +119,195 @@ class FirebaseStorage(Storage):
         return records
 
     def query_records(self, name_query=None, groups=None, model_types=None, show_downloaded=None,
-                      show_not_downloaded=None) -> List:
+                      show_not_downloaded=None, full_text=False, sort_order: Optional[ModelSort] = None,
+                      sort_downloaded_first=False, limit: Optional[int] = None, offset=0) -> List:
+        if self._mirror is not None:
+            records = self._get_mirror_records()
+            if model_types is not None and model_types:
+                records = [record for record in records if record.model_type.value in model_types]
+            return self._filter_records(records, name_query, groups, show_downloaded, show_not_downloaded, full_text,
+                                        sort_order, sort_downloaded_first, limit, offset)
 
         query_ref = self._records()
         if model_types is not None and model_types:
             query_ref = query_ref.where('model_type', 'in', model_types)
+        # Firestore allows a single array_contains filter, so only the first group is matched by the server.
+        if groups is not None and groups:
+            query_ref = query_ref.where('groups', 'array_contains', groups[0])
+
+        # Order and page are applied by Firestore only when the rest of filters don't run in Python. Ordering by name
+        # stays in Python, because Firestore compares strings case-sensitively, and model_type or groups filters with
+        # ordering would require composite indexes.
+        is_server_page = not name_query and not groups and show_downloaded and show_not_downloaded and \
+            not sort_downloaded_first and not model_types and \
+            sort_order in (ModelSort.TIME_ADDED_ASC, ModelSort.TIME_ADDED_DESC)
+        if is_server_page:
+            return self._query_server_page(query_ref, sort_order, limit, offset)
+
+        # Projected documents are billed as reads too, so filter fields are streamed first and the page is read in
+        # full only when the page is limited. Full text search ranks by all text fields, and without the limit every
+        # matched document would be read twice, so full documents are streamed once in these cases.
+        is_full_text = name_query is not None and name_query and full_text
+        is_projected = not is_full_text and limit is not None
+        if is_projected:
+            query_ref = query_ref.select(_FILTER_FIELDS)
 
         records = []
         for ref in query_ref.stream():
-            records.append(map_dict_to_record(ref.id, ref.to_dict()))
+            if is_projected:
+                records.append(_map_filter_fields(ref))
+            else:
+                records.append(map_dict_to_record(ref.id, ref.to_dict()))
+
+        records = self._filter_records(records, name_query, groups, show_downloaded, show_not_downloaded, full_text,
+                                       sort_order, sort_downloaded_first, limit, offset)
+        if not is_projected:
+            return records
 
-        if name_query is not None and name_query:
+        downloaded = {record.id_: record.downloaded for record in records}
+        full_records = self._get_records_by_ids(list(downloaded.keys()))
+        for record in full_records:
+            record.downloaded = downloaded[record.id_]
+        return full_records
+
+    @staticmethod
+    def _filter_records(records: List, name_query, groups, show_downloaded, show_not_downloaded, full_text,
+                        sort_order: Optional[ModelSort], sort_downloaded_first, limit: Optional[int], offset) -> List:
+        if name_query is not None and name_query and full_text:
+            tokens = re.findall(r'\w+', name_query.lower())
+            if tokens:
+                ranks = {record.id_: _search_rank(record, tokens) for record in records}
+                records = [record for record in records if ranks[record.id_] > 0]
+                records.sort(key=lambda r: ranks[r.id_], reverse=True)
+                sort_order = None
+        elif name_query is not None and name_query:
             records = [record for record in records if name_query.lower() in record.name.lower()]
 
         if groups is not None and len(groups) > 0:
             records = [item for item in records if all(val in item.groups for val in groups)]
 
-        records = list(filter(lambda r: _filter_download(r, show_downloaded, show_not_downloaded), records))
+        records = filter_by_downloaded_state(records, show_downloaded, show_not_downloaded)
+        records = sort_records(records, sort_order, sort_downloaded_first)
+        return slice_records(records, limit, offset)
+
+    def _query_server_page(self, query_ref, sort_order: ModelSort, limit: Optional[int], offset) -> List:
+        direction = firestore.Query.ASCENDING if sort_order == ModelSort.TIME_ADDED_ASC else \
+            firestore.Query.DESCENDING
+        query_ref = query_ref.order_by('created_at', direction=direction)
+        if offset:
+            cursor = self._get_page_cursor(direction, offset)
+            if cursor is not None:
+                query_ref = query_ref.start_after(cursor)
+            else:
+                query_ref = query_ref.offset(offset)
+        if limit is not None:
+            query_ref = query_ref.limit(limit)
 
+        records = []
+        last_snapshot = None
+        for snapshot in query_ref.stream():
+            records.append(map_dict_to_record(snapshot.id, snapshot.to_dict()))
+            last_snapshot = snapshot
+        if last_snapshot is not None:
+            self._put_page_cursor(direction, offset + len(records), last_snapshot)
         return records
 
     def get_record_by_id(self, _id) -> Record:
+        if self._mirror is not None:
+            data = self._mirror.get_document(_id)
+            return None if data is None else map_dict_to_record(_id, data)
+
         doc = self._records().document(_id).get()
+        if not doc.exists:
+            return None
         return map_dict_to_record(doc.id, doc.to_dict())
 
     def add_record(self, record: Record):
-        self._records().add(map_record_to_dict(record))
+        data = map_record_to_dict(record)
+        _, ref = self._records().add(data)
+        self._clear_page_cursors()
+        if self._mirror is not None:
+            data['id'] = ref.id
+            self._mirror.put(ref.id, data)
+
+    def add_records(self, records: List):
+        for start in range(0, len(records), _MAX_BATCH_SIZE):
+            batch = self.firestore_client.batch()
+            documents = []
+            for record in records[start:start + _MAX_BATCH_SIZE]:
+                ref = self._records().document()
+                data = map_record_to_dict(record)
+                batch.set(ref, data)
+                documents.append((ref.id, data))
+            batch.commit()
+
+            if self._mirror is not None:
+                for id_, data in documents:
+                    data['id'] = id_
+                self._mirror.put_all(dict(documents))
+        self._clear_page_cursors()
 
     def update_record(self, record: Record):
         ref = self._records().document(record.id_)
-        ref.update(map_record_to_dict(record))
+        data = map_record_to_dict(record)
+        ref.update(data)
+        self._clear_page_cursors()
+        if self._mirror is not None:
+            self._mirror.put(record.id_, data)
+
+    def update_records(self, records: List):
+        for start in range(0, len(records), _MAX_BATCH_SIZE):
+            batch = self.firestore_client.batch()
+            documents = {}
+            for record in records[start:start + _MAX_BATCH_SIZE]:
+                data = map_record_to_dict(record)
+                batch.update(self._records().document(record.id_), data)
+                documents[record.id_] = data
+            batch.commit()
+
+            if self._mirror is not None:
+                self._mirror.put_all(documents)
+        self._clear_page_cursors()
 
     def remove_record(self, _id):
         self._records().document(_id).delete()
+        self._clear_page_cursors()
+        if self._mirror is not None:
+            self._mirror.delete(_id)
+
+    def remove_records(self, ids: List):
+        for start in range(0, len(ids), _MAX_BATCH_SIZE):
+            batch = self.firestore_client.batch()
+            chunk = ids[start:start + _MAX_BATCH_SIZE]
+            for id_ in chunk:
+                batch.delete(self._records().document(id_))
+            batch.commit()
+
+            if self._mirror is not None:
+                self._mirror.delete_all(chunk)
+        self._clear_page_cursors()
+
+    def get_change_token(self) -> Optional[str]:
+        if self._mirror is None:
+            return None
+        return f'{self._session}-{self._mirror.version}'
 
     def get_available_groups(self) -> List:
-        records = self.get_all_records()
+        if self._mirror is not None:
+            return list(set(group for record in self._get_mirror_records() for group in record.groups))
+
         groups = []
-        for record in records:
-            if len(record.groups) > 0:
-                groups.extend(record.groups)
+        for ref in self._records().select(['groups']).stream():
+            groups.extend(ref.to_dict().get('groups', []))
         return list(set(groups))
 
     def get_records_by_group(self, group: str) -> List:
+        if self._mirror is not None:
+            return [record for record in self._get_mirror_records() if group in record.groups]
+
         col_ref = self._records()
 
-        query_ref = col_ref.where('group', 'array_contains', f'%{group}%')
+        query_ref = col_ref.where('groups', 'array_contains', group)
 
         records = []
         for ref in query_ref.stream():
@@ -87,9 +315,12 @@ class FirebaseStorage(Storage):
         return records
 
     def get_all_records_locations(self) -> List:
-        records = self.get_all_records()
+        if self._mirror is not None:
+            return list(set(record.location for record in self._get_mirror_records() if record.location))
+
         locations = []
-        for record in records:
-            if record.location:
-                locations.append(record.location)
+        for ref in self._records().select(['location']).stream():
+            location = ref.to_dict().get('location')
+            if location:
+                locations.append(location)
         return list(set(locations))
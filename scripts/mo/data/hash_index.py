@@ -0,0 +1,183 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+
+from scripts.mo.data.hash_worker import hash_file
+from scripts.mo.environment import env, logger
+
+_DB_FILE = 'hash_cache.sqlite'
+_DB_TIMEOUT = 30
+_QUERY_CHUNK_SIZE = 500
+
+
+def calculate_autov2(sha256_hash: str) -> str:
+    return sha256_hash[:10].upper() if sha256_hash else ''
+
+
+def _map_row_to_entry(row) -> dict:
+    return {
+        'path': row[0],
+        'size': row[1],
+        'mtime_ns': row[2],
+        'inode': row[3],
+        'sha256': row[4],
+        'md5': row[5],
+        'autov2': calculate_autov2(row[4]),
+        'updated_at': row[6]
+    }
+
+
+def _is_signature_matches(row, stat_result) -> bool:
+    return row[1] == stat_result.st_size and row[2] == stat_result.st_mtime_ns and row[3] == stat_result.st_ino
+
+
+class HashIndex:
+    """
+    Persistent file hashes index. Entries are keyed by file path and are valid only while file size, modification time
+    and inode are the same as at the time of hashing.
+    """
+    __instance = None
+    __lock = threading.Lock()
+
+    def __init__(self):
+        self.local = threading.local()
+        self._initialize()
+
+    @staticmethod
+    def instance():
+        if HashIndex.__instance is None:
+            with HashIndex.__lock:
+                if HashIndex.__instance is None:
+                    HashIndex.__instance = HashIndex()
+        return HashIndex.__instance
+
+    def _connection(self):
+        if not hasattr(self.local, "connection"):
+            db_file_path = os.path.join(env.script_dir, _DB_FILE)
+            self.local.connection = sqlite3.connect(db_file_path, _DB_TIMEOUT)
+        return self.local.connection
+
+    def _initialize(self):
+        cursor = self._connection().cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('''CREATE TABLE IF NOT EXISTS FileHash
+                                    (path TEXT PRIMARY KEY,
+                                    size INTEGER,
+                                    mtime_ns INTEGER,
+                                    inode INTEGER,
+                                    sha256 TEXT DEFAULT '',
+                                    md5 TEXT DEFAULT '',
+                                    updated_at REAL DEFAULT 0)
+                                 ''')
+        self._connection().commit()
+
+    def lookup(self, path: str, stat_result=None) -> Optional[dict]:
+        """
+        Looks for file hashes calculated before.
+        :param path: file path.
+        :param stat_result: file stat result, file is stated if None.
+        :return: entry dictionary or None if file wasn't hashed or was changed since.
+        """
+        if stat_result is None:
+            try:
+                stat_result = os.stat(path)
+            except OSError:
+                return None
+
+        cursor = self._connection().cursor()
+        cursor.execute('SELECT * FROM FileHash WHERE path=?', (path,))
+        row = cursor.fetchone()
+        if row is None or not _is_signature_matches(row, stat_result) or not row[4]:
+            return None
+        return _map_row_to_entry(row)
+
+    def lookup_many(self, paths: List) -> dict:
+        """
+        Looks for hashes of several files with a single query per chunk of paths.
+        :param paths: files paths.
+        :return: dictionary of valid entries by path.
+        """
+        rows = {}
+        cursor = self._connection().cursor()
+        for i in range(0, len(paths), _QUERY_CHUNK_SIZE):
+            chunk = paths[i:i + _QUERY_CHUNK_SIZE]
+            cursor.execute(f'SELECT * FROM FileHash WHERE path IN ({", ".join("?" * len(chunk))})', chunk)
+            for row in cursor.fetchall():
+                rows[row[0]] = row
+
+        result = {}
+        for path, row in rows.items():
+            try:
+                stat_result = os.stat(path)
+            except OSError:
+                continue
+            if _is_signature_matches(row, stat_result) and row[4]:
+                result[path] = _map_row_to_entry(row)
+        return result
+
+    def put(self, path: str, sha256: str, md5: str = '', stat_result=None):
+        """
+        Saves file hashes with current file signature.
+        :param path: file path.
+        :param sha256: SHA256 hex digest string.
+        :param md5: MD5 hex digest string.
+        :param stat_result: file stat result, file is stated if None.
+        :return: None
+        """
+        if stat_result is None:
+            stat_result = os.stat(path)
+
+        cursor = self._connection().cursor()
+        cursor.execute('''INSERT OR REPLACE INTO FileHash(path, size, mtime_ns, inode, sha256, md5, updated_at)
+                          VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                       (path, stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ino, sha256, md5,
+                        time.time()))
+        self._connection().commit()
+
+    def put_many(self, entries: List):
+        """
+        Saves hashes of several files in a single transaction.
+        :param entries: list of (path, sha256, md5, stat_result) tuples.
+        :return: None
+        """
+        cursor = self._connection().cursor()
+        cursor.executemany('''INSERT OR REPLACE INTO FileHash(path, size, mtime_ns, inode, sha256, md5, updated_at)
+                              VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                           [(path, stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ino, sha256, md5,
+                             time.time()) for path, sha256, md5, stat_result in entries])
+        self._connection().commit()
+
+    def get_hashes(self, path: str) -> dict:
+        """
+        Returns file hashes from index, file is hashed only if it is missing in index or was changed.
+        :param path: file path.
+        :return: entry dictionary.
+        """
+        stat_result = os.stat(path)
+        entry = self.lookup(path, stat_result)
+        if entry is not None and entry['md5']:
+            return entry
+
+        logger.debug('Calculating hashes: %s', path)
+        _, sha256, md5 = hash_file(path)
+        self.put(path, sha256, md5, stat_result)
+        return self.lookup(path, stat_result)
+
+    def get_sha256(self, path: str) -> str:
+        stat_result = os.stat(path)
+        entry = self.lookup(path, stat_result)
+        if entry is not None:
+            return entry['sha256']
+        return self.get_hashes(path)['sha256']
+
+    def get_all_entries(self) -> List:
+        cursor = self._connection().cursor()
+        cursor.execute('SELECT * FROM FileHash ORDER BY path')
+        return [_map_row_to_entry(row) for row in cursor.fetchall()]
+
+    def remove(self, path: str):
+        cursor = self._connection().cursor()
+        cursor.execute('DELETE FROM FileHash WHERE path=?', (path,))
+        self._connection().commit()
@@ -0,0 +1,44 @@
+# This module is executed in hashing worker processes, keep it free of webui and extension imports.
+import hashlib
+import mmap
+import os
+
+_READ_SIZE = 8 * 1024 * 1024  # 8MB
+
+
+def _update_from_mmap(file, size, hashers):
+    with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        with memoryview(mapped) as view:
+            for offset in range(0, size, _READ_SIZE):
+                block = view[offset:offset + _READ_SIZE]
+                for hasher in hashers:
+                    hasher.update(block)
+                block.release()
+
+
+def _update_from_reads(file, hashers):
+    file.seek(0)
+    while chunk := file.read(_READ_SIZE):
+        for hasher in hashers:
+            hasher.update(chunk)
+
+
+def hash_file(path: str):
+    """
+    Calculates SHA256 and MD5 file hashes in a single pass. File is read through mmap in large blocks, regular reads
+    are used where mmap is not available.
+    :param path: target file path.
+    :return: tuple of path, SHA256 hex digest string and MD5 hex digest string.
+    """
+    sha256 = hashlib.sha256()
+    md5 = hashlib.md5()
+    with open(path, 'rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        if size > 0:
+            try:
+                _update_from_mmap(file, size, (sha256, md5))
+            except (OSError, ValueError):
+                sha256 = hashlib.sha256()
+                md5 = hashlib.md5()
+                _update_from_reads(file, (sha256, md5))
+    return path, sha256.hexdigest(), md5.hexdigest()
@@ -1,3 +1,4 @@
+from scripts.mo.data.cached_storage import CachedStorage
 from scripts.mo.environment import env, STORAGE_SQLITE, STORAGE_FIREBASE
 
 
@@ -15,7 +16,9 @@ def _init_firebase_storage():
     error = None
     try:
         from scripts.mo.data.firebase_storage import FirebaseStorage
-        env.storage = FirebaseStorage()
+        storage = FirebaseStorage()
+        # SQLite answers lookups from its indexes, only records mirrored from Firestore are worth keeping in memory.
+        env.storage = CachedStorage(storage) if env.firebase_mirror() else storage
     except Exception as e:
         error = f'failed to init Firebase storage: {e}'
     return error
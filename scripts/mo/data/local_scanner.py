@@ -0,0 +1,123 @@
+import os
+import threading
+import time
+from typing import List, Optional
+
+# Directory listing is not trusted when it was taken this close to the directory modification, because file
+# systems with coarse timestamps might change the directory again within the same mtime tick.
+_MTIME_GRANULARITY_NS = 2 * 1000 * 1000 * 1000
+
+
+class _DirListing:
+    def __init__(self, mtime_ns: int, listed_at_ns: int, files: List, subdirs: List):
+        self.mtime_ns = mtime_ns
+        self.listed_at_ns = listed_at_ns
+        self.files = files
+        self.subdirs = subdirs
+
+    def is_valid(self, mtime_ns: int) -> bool:
+        return self.mtime_ns == mtime_ns and self.listed_at_ns - self.mtime_ns > _MTIME_GRANULARITY_NS
+
+
+class LocalScanner:
+    """
+    Incremental local files scanner. Directory listings are cached and a directory is listed again only when its
+    modification time changes, so a rescan of unchanged tree costs a single stat call per directory.
+    """
+    __instance = None
+    __lock = threading.Lock()
+
+    def __init__(self):
+        self._cache = {}
+        self._cache_lock = threading.Lock()
+
+    @staticmethod
+    def instance():
+        if LocalScanner.__instance is None:
+            with LocalScanner.__lock:
+                if LocalScanner.__instance is None:
+                    LocalScanner.__instance = LocalScanner()
+        return LocalScanner.__instance
+
+    def list_dir(self, dir_path: str) -> Optional[_DirListing]:
+        """
+        Returns directory listing, directory is read only when it was changed since the previous call.
+        :param dir_path: directory path.
+        :return: listing with file and subdirectory names or None if directory doesn't exist.
+        """
+        try:
+            mtime_ns = os.stat(dir_path).st_mtime_ns
+        except OSError:
+            self._forget(dir_path)
+            return None
+
+        with self._cache_lock:
+            cached = self._cache.get(dir_path)
+        if cached is not None and cached.is_valid(mtime_ns):
+            return cached
+
+        listed_at_ns = time.time_ns()
+        files = []
+        subdirs = []
+        try:
+            with os.scandir(dir_path) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.name)
+                        elif entry.is_file():
+                            files.append(entry.name)
+                    except OSError:
+                        pass
+        except OSError:
+            self._forget(dir_path)
+            return None
+
+        listing = _DirListing(mtime_ns, listed_at_ns, files, subdirs)
+        with self._cache_lock:
+            if cached is not None:
+                for removed in set(cached.subdirs) - set(subdirs):
+                    self._forget_locked(os.path.join(dir_path, removed))
+            self._cache[dir_path] = listing
+        return listing
+
+    def walk(self, root_dir: str):
+        """
+        Walks directory tree top-down like os.walk, using cached listings of unchanged directories.
+        :param root_dir: directory to walk.
+        :return: generator of (dir_path, subdir names, file names) tuples.
+        """
+        stack = [root_dir]
+        while stack:
+            dir_path = stack.pop()
+            listing = self.list_dir(dir_path)
+            if listing is None:
+                continue
+            yield dir_path, listing.subdirs, listing.files
+            for subdir in reversed(listing.subdirs):
+                stack.append(os.path.join(dir_path, subdir))
+
+    def get_files(self, lookup_dir: str, extensions) -> List:
+        """
+        Scans for files with given extensions in the lookup_dir, and it's child directories.
+        :param lookup_dir: directory path to scan.
+        :param extensions: lower case file extensions to look for.
+        :return: list of files paths.
+        """
+        root_dir = os.path.join(lookup_dir, '')
+        result = []
+        for dir_path, _, files in self.walk(root_dir):
+            for file in files:
+                if os.path.splitext(file)[-1].lower() in extensions:
+                    result.append(os.path.join(dir_path, file))
+        return result
+
+    def _forget(self, dir_path: str):
+        with self._cache_lock:
+            self._forget_locked(dir_path)
+
+    def _forget_locked(self, dir_path: str):
+        self._cache.pop(dir_path, None)
+        prefix = os.path.join(dir_path, '')
+        for key in [key for key in self._cache.keys() if key.startswith(prefix)]:
+            del self._cache[key]
@@ -0,0 +1,102 @@
+import os
+import threading
+from typing import Optional, Tuple
+
+from scripts.mo.data.local_scanner import LocalScanner
+from scripts.mo.models import Record
+from scripts.mo.utils import PREVIEW_EXTENSIONS, get_model_filename_without_extension, link_preview
+
+
+class _DirPreviews:
+    def __init__(self, listing):
+        self.listing = listing
+        self.files = set(listing.files)
+        self.previews = {}
+
+
+class PreviewResolver:
+    """
+    Finds model previews from directory listings of the LocalScanner instead of checking every candidate file. Found
+    preview names are memoized until the directory listing is changed, only the found preview is checked for its
+    modification time.
+    """
+    __instance = None
+    __lock = threading.Lock()
+
+    def __init__(self):
+        self._dirs = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def instance():
+        if PreviewResolver.__instance is None:
+            with PreviewResolver.__lock:
+                if PreviewResolver.__instance is None:
+                    PreviewResolver.__instance = PreviewResolver()
+        return PreviewResolver.__instance
+
+    def find_preview(self, model_file_path: str) -> Optional[Tuple[str, float]]:
+        """
+        Looks for model image preview, same preview names as in utils.find_preview_file are checked.
+        :param model_file_path: path to model file.
+        :return: tuple of preview path and its modification time if preview exists, None otherwise.
+        """
+        if not model_file_path:
+            return None
+
+        dir_path = os.path.dirname(model_file_path)
+        listing = LocalScanner.instance().list_dir(dir_path if dir_path else os.curdir)
+        if listing is None:
+            return None
+
+        with self._lock:
+            dir_previews = self._dirs.get(dir_path)
+            if dir_previews is None or dir_previews.listing is not listing:
+                dir_previews = _DirPreviews(listing)
+                self._dirs[dir_path] = dir_previews
+
+        filename_no_ext = get_model_filename_without_extension(model_file_path)
+        if filename_no_ext in dir_previews.previews:
+            path = dir_previews.previews[filename_no_ext]
+        else:
+            path = None
+            potential_files = sum([[filename_no_ext + ext, filename_no_ext + '.preview' + ext]
+                                   for ext in PREVIEW_EXTENSIONS], [])
+            for name in potential_files:
+                if name in dir_previews.files:
+                    path = os.path.join(dir_path, name)
+                    break
+            dir_previews.previews[filename_no_ext] = path
+
+        if path is None:
+            return None
+        # Preview overwritten in place keeps the directory listing, so its own mtime is always checked.
+        try:
+            return path, os.path.getmtime(path)
+        except OSError:
+            return None
+
+    def invalidate(self, path: str):
+        """
+        Drops memoized previews of the file directory.
+        :param path: changed preview file path.
+        :return: None
+        """
+        with self._lock:
+            self._dirs.pop(os.path.dirname(path), None)
+
+
+def get_best_preview_url(record: Record, original: bool = False) -> str:
+    """
+    Returns url to local preview file if it available otherwise returns record.preview_url
+    :param record: record to get preview.
+    :param original: return url to the full size local preview instead of the card size thumbnail.
+    :return: url to image preview.
+    """
+    if record.location:
+        preview = PreviewResolver.instance().find_preview(record.location)
+        if preview is None:
+            return record.preview_url
+        else:
+            return link_preview(*preview, original=original)
+    return record.preview_url
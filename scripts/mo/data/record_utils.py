@@ -1,59 +1,18 @@
 import json
 import os
-from typing import List, Dict
+import threading
+from typing import List, Dict, Optional
 
+from scripts.mo.data.file_watcher import FileWatcher, FILE_KIND_MODEL
+from scripts.mo.data.hash_index import HashIndex
 from scripts.mo.data.mapping_utils import create_version_dict
-from scripts.mo.environment import env
+from scripts.mo.data.storage import sort_records, slice_records
+from scripts.mo.environment import env, logger
 from scripts.mo.models import ModelSort, Record, ModelType
-from scripts.mo.utils import get_model_files_in_dir, find_info_file
-
-
-def _sort_records(records: List, sort_order: ModelSort, sort_downloaded_first: bool) -> List:
-    if sort_downloaded_first:
-        if sort_order == ModelSort.TIME_ADDED_ASC:
-            sorted_records = sorted(records,
-                                    key=lambda r: (not (bool(r.location) and os.path.exists(r.location)), r.created_at))
-        elif sort_order == ModelSort.TIME_ADDED_DESC:
-            sorted_records = sorted(records,
-                                    key=lambda r: (bool(r.location) and os.path.exists(r.location), r.created_at),
-                                    reverse=True)
-        elif sort_order == ModelSort.NAME_ASC:
-            sorted_records = sorted(records,
-                                    key=lambda r: (not (bool(r.location) and os.path.exists(r.location)), r.name))
-        elif sort_order == ModelSort.NAME_DESC:
-            sorted_records = sorted(records, key=lambda r: (bool(r.location) and os.path.exists(r.location), r.name),
-                                    reverse=True)
-        else:
-            raise ValueError(f'An unhandled sort_order value: {sort_order.value}')
-    else:
-        if sort_order == ModelSort.TIME_ADDED_ASC:
-            sorted_records = sorted(records, key=lambda record: record.created_at)
-        elif sort_order == ModelSort.TIME_ADDED_DESC:
-            sorted_records = sorted(records, key=lambda record: record.created_at, reverse=True)
-        elif sort_order == ModelSort.NAME_ASC:
-            sorted_records = sorted(records, key=lambda record: record.name)
-        elif sort_order == ModelSort.NAME_DESC:
-            sorted_records = sorted(records, key=lambda record: record.name, reverse=True)
-        else:
-            raise ValueError(f'An unhandled sort_order value: {sort_order.value}')
-    return sorted_records
 
 
 def _find_local_model_files() -> List:
-    result = []
-
-    def search_in_dir(model_type) -> List:
-        dir_path = env.get_model_path(model_type)
-        return get_model_files_in_dir(dir_path)
-
-    result.extend(search_in_dir(ModelType.CHECKPOINT))
-    result.extend(search_in_dir(ModelType.VAE))
-    result.extend(search_in_dir(ModelType.LORA))
-    result.extend(search_in_dir(ModelType.HYPER_NETWORK))
-    result.extend(search_in_dir(ModelType.EMBEDDING))
-    result.extend(search_in_dir(ModelType.LYCORIS))
-
-    return result
+    return FileWatcher.instance().get_all_model_files()
 
 
 def _create_model_from_info_file(path, info_file_path, model_type):
@@ -108,7 +67,7 @@ def _get_model_type_from_file(path):
 def _create_record_from_file(model_file_path):
     model_type = _get_model_type_from_file(model_file_path)
 
-    info_file = find_info_file(model_file_path)
+    info_file = FileWatcher.instance().find_info_file(model_file_path)
 
     if info_file is None:
         return _create_model_from_local_file(model_file_path, model_type)
@@ -120,9 +79,12 @@ def _create_record_from_file(model_file_path):
 
 def _create_record_from_files(model_file_list):
     result = []
+    cached_hashes = HashIndex.instance().lookup_many(model_file_list)
     for file in model_file_list:
         rec = _create_record_from_file(file)
         if rec is not None:
+            if not rec.sha256_hash and cached_hashes.get(file) is not None:
+                rec.sha256_hash = cached_hashes[file]['sha256']
             result.append(rec)
     return result
 
@@ -142,31 +104,81 @@ def _filter_records_by_state(records: List, state: Dict):
     return records
 
 
-def load_records_and_filter(state: Dict, include_local_files: bool):
-    records = env.storage.query_records(
-        name_query=state['query'],
-        groups=state['groups'],
-        model_types=state['model_types'],
-        show_downloaded=state['show_downloaded'],
-        show_not_downloaded=state['show_not_downloaded']
-    )
+def _find_unbound_local_records(state: Dict) -> List:
+    model_files_list = _find_local_model_files()
+    if len(model_files_list) == 0:
+        return []
+
+    bound_files = set(filter(lambda r: bool(r), env.storage.get_all_records_locations()))
+    not_bound_files = list(filter(lambda r: r not in bound_files, model_files_list))
+    if len(not_bound_files) == 0:
+        return []
+
+    local_records = _create_record_from_files(not_bound_files)
+    return _filter_records_by_state(local_records, state)
 
+
+def load_records_and_filter(state: Dict, include_local_files: bool, limit: Optional[int] = None, offset=0):
+    """
+    Loads records for the filter state. Sorting and paging are done by storage, unless local files records have to be
+    merged into the result.
+    :param state: home screen filter state.
+    :param include_local_files: adds records for local files that are not bound to records if state allows it.
+    :param limit: page size, all records are returned if None.
+    :param offset: page offset.
+    :return: list of records.
+    """
+    local_records = []
     if state['show_local_files'] and include_local_files:
-        model_files_list = _find_local_model_files()
-
-        if len(model_files_list) > 0:
-            bound_files = env.storage.get_all_records_locations()
-            bound_files = list(filter(lambda r: bool(r), bound_files))
-            not_bound_files = list(filter(lambda r: r not in bound_files, model_files_list))
-            if len(not_bound_files) > 0:
-                local_records = _create_record_from_files(not_bound_files)
-                local_records = _filter_records_by_state(local_records, state)
-                if len(local_records) > 0:
-                    records.extend(local_records)
-
-    records = _sort_records(
+        local_records = _find_unbound_local_records(state)
+
+    query = {
+        'name_query': state['query'],
+        'groups': state['groups'],
+        'model_types': state['model_types'],
+        'show_downloaded': state['show_downloaded'],
+        'show_not_downloaded': state['show_not_downloaded'],
+        'full_text': state.get('full_text', False),
+        'sort_order': ModelSort.by_value(state['sort_order']),
+        'sort_downloaded_first': state['sort_downloaded_first']
+    }
+
+    if len(local_records) == 0:
+        return env.storage.query_records(**query, limit=limit, offset=offset)
+
+    records = env.storage.query_records(**query)
+    records.extend(local_records)
+
+    # Full-text search results are kept in relevance order.
+    is_ranked = bool(state['query']) and state.get('full_text', False)
+    records = sort_records(
         records=records,
-        sort_order=ModelSort.by_value(state['sort_order']),
+        sort_order=None if is_ranked else query['sort_order'],
         sort_downloaded_first=state['sort_downloaded_first']
     )
-    return records
+    return slice_records(records, limit, offset)
+
+
+def _on_local_files_changed(events: List):
+    locations = [event['path'] for event in events if event['kind'] == FILE_KIND_MODEL]
+    if locations:
+        env.storage.update_files_state(locations)
+
+
+def _refresh_files_state():
+    try:
+        env.storage.refresh_files_state()
+    except Exception as ex:
+        logger.exception(ex)
+
+
+def start_files_state_tracking():
+    """
+    Keeps records files state saved in storage up to date with local files changes. All records are verified once in
+    background, then only changed files are updated.
+    :return: None
+    """
+    watcher = FileWatcher.instance()
+    watcher.add_listener(_on_local_files_changed)
+    threading.Thread(target=_refresh_files_state, name='mo-files-state', daemon=True).start()
+    watcher.start()
@@ -0,0 +1,91 @@
+import json
+import os
+from typing import Iterator
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# Extensions of files with one JSON record per line.
+NDJSON_EXTENSIONS = ['.jsonl', '.ndjson']
+
+_READ_CHUNK_SIZE = 64 * 1024
+
+
+def _read_ndjson(path: str) -> Iterator[dict]:
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def _read_array_items(path: str) -> Iterator[dict]:
+    """
+    Reads items of JSON array one by one with the standard decoder, only the current item is kept in memory.
+    :param path: JSON file path.
+    :return: generator of array items.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        buffer = ''
+        position = 0
+        is_array_started = False
+        is_eof = False
+        while True:
+            # Separators between items are skipped before every item.
+            while position < len(buffer) and (buffer[position].isspace() or buffer[position] == ','):
+                position += 1
+
+            if position < len(buffer):
+                if not is_array_started:
+                    if buffer[position] != '[':
+                        raise ValueError('JSON file should contain array of records')
+                    is_array_started = True
+                    position += 1
+                    continue
+                if buffer[position] == ']':
+                    return
+                try:
+                    item, end = decoder.raw_decode(buffer, position)
+                    # Numbers might be cut by the chunk end, so the item is decoded again with more data.
+                    if end < len(buffer) or is_eof:
+                        yield item
+                        position = end
+                        continue
+                except json.JSONDecodeError:
+                    if is_eof:
+                        raise
+
+            if is_eof:
+                if is_array_started:
+                    raise ValueError('Unexpected end of JSON file')
+                return
+
+            chunk = f.read(_READ_CHUNK_SIZE)
+            is_eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+
+
+def _read_ijson(path: str) -> Iterator[dict]:
+    with open(path, 'rb') as f:
+        # Floats are used instead of Decimal values, the same as json module does.
+        for item in ijson.items(f, 'item', use_float=True):
+            yield item
+
+
+def read_records(path: str) -> Iterator[dict]:
+    """
+    Reads records dictionaries from the import file without loading the whole file. Files with .jsonl or .ndjson
+    extension have a record per line, other files contain JSON array of records. Array is parsed by ijson when it's
+    installed.
+    :param path: import file path.
+    :return: generator of records dictionaries.
+    """
+    if os.path.splitext(path)[-1].lower() in NDJSON_EXTENSIONS:
+        return _read_ndjson(path)
+    if ijson is not None:
+        return _read_ijson(path)
+    return _read_array_items(path)
@@ -1,19 +1,33 @@
 import os
+import re
 import sqlite3
 import threading
-from typing import List
+import time
+from typing import List, Optional
 
+from scripts.mo.data.downloaded_state import resolve_downloaded_state
 from scripts.mo.data.storage import Storage
 from scripts.mo.environment import env, logger
-from scripts.mo.models import Record, ModelType
+from scripts.mo.models import Record, ModelType, ModelSort
 
 _DB_FILE = 'database.sqlite'
-_DB_VERSION = 5
+_DB_VERSION = 7
 _DB_TIMEOUT = 30
 
+# Weights of _name, description, positive_prompts, negative_prompts and groups columns for the bm25 ranking.
+_SEARCH_RANK_WEIGHTS = '10.0, 1.0, 2.0, 1.0, 5.0'
+_SEARCH_COLUMNS = ['_name', 'description', 'positive_prompts', 'negative_prompts', 'groups']
+
+_SORT_ORDER_BY = {
+    ModelSort.TIME_ADDED_ASC: 'created_at ASC, id ASC',
+    ModelSort.TIME_ADDED_DESC: 'created_at DESC, id DESC',
+    ModelSort.NAME_ASC: '_name COLLATE NOCASE ASC, id ASC',
+    ModelSort.NAME_DESC: '_name COLLATE NOCASE DESC, id DESC'
+}
+
 
 def map_row_to_record(row) -> Record:
-    return Record(
+    record = Record(
         id_=row[0],
         name=row[1],
         model_type=ModelType.by_value(row[2]),
@@ -32,12 +46,98 @@ def map_row_to_record(row) -> Record:
         subdir=row[15],
         location=row[16]
     )
+    record.downloaded = bool(row[19])
+    return record
+
+
+def _get_file_state(location: str):
+    """
+    Reads model file state to be saved with the record.
+    :param location: model file path.
+    :return: tuple of file size, modification time and presence flag.
+    """
+    if location:
+        try:
+            stat_result = os.stat(location)
+            return stat_result.st_size, stat_result.st_mtime, 1
+        except OSError:
+            pass
+    return 0, 0, 0
+
+
+def _is_fts5_available() -> bool:
+    connection = sqlite3.connect(':memory:')
+    try:
+        connection.execute('CREATE VIRTUAL TABLE fts5_probe USING fts5(value)')
+        return True
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        connection.close()
+
+
+def _get_search_tokens(query: str) -> List:
+    return re.findall(r'\w+', query.lower())
+
+
+def _create_match_expression(tokens: List) -> str:
+    """
+    Creates FTS5 MATCH expression that requires every token as a word prefix.
+    :param tokens: search tokens containing only word characters.
+    :return: MATCH expression string.
+    """
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def _escape_like(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+class _QueryBuilder:
+    """
+    Builds parameterized SELECT statement. Values are always bound as parameters, so statements are the same for
+    different search strings and are reused from the SQLite statement cache.
+    """
+
+    def __init__(self, select: str):
+        self.select = select
+        self.select_params = []
+        self.conditions = []
+        self.params = []
+        self.order_by = []
+        self.limit = None
+        self.offset = 0
+
+    def where(self, condition: str, *params):
+        self.conditions.append(condition)
+        self.params.extend(params)
+
+    def where_in(self, column: str, values: List):
+        self.where(f'{column} IN ({", ".join("?" * len(values))})', *values)
+
+    def build(self):
+        sql = self.select
+        if self.conditions:
+            sql += ' WHERE ' + ' AND '.join(self.conditions)
+        params = self.select_params + self.params
+        if self.order_by:
+            sql += ' ORDER BY ' + ', '.join(self.order_by)
+        if self.limit is not None:
+            sql += ' LIMIT ? OFFSET ?'
+            params += [self.limit, self.offset]
+        elif self.offset:
+            sql += ' LIMIT -1 OFFSET ?'
+            params.append(self.offset)
+        return sql, params
 
 
 class SQLiteStorage(Storage):
 
     def __init__(self):
         self.local = threading.local()
+        self.is_full_text_available = _is_fts5_available()
+        self._session = time.time_ns()
+        self._changes = 0
         self._initialize()
 
     def _connection(self):
@@ -66,13 +166,23 @@ class SQLiteStorage(Storage):
                                     created_at INTEGER DEFAULT 0,
                                     groups TEXT DEFAULT '',
                                     subdir TEXT DEFAULT '',
-                                    location TEXT DEFAULT '')
+                                    location TEXT DEFAULT '',
+                                    file_size INTEGER DEFAULT 0,
+                                    file_mtime REAL DEFAULT 0,
+                                    is_present INTEGER DEFAULT 0)
+                                 ''')
+
+        cursor.execute('''CREATE TABLE IF NOT EXISTS RecordGroup
+                                    (record_id INTEGER NOT NULL,
+                                    group_name TEXT NOT NULL COLLATE NOCASE,
+                                    PRIMARY KEY (record_id, group_name))
                                  ''')
 
         cursor.execute(f'''CREATE TABLE IF NOT EXISTS Version
                                 (version INTEGER DEFAULT {_DB_VERSION})''')
         self._connection().commit()
         self._check_database_version()
+        self._create_indexes()
 
     def _check_database_version(self):
         cursor = self._connection().cursor()
@@ -97,6 +207,10 @@ class SQLiteStorage(Storage):
                 self._migrate_3_to_4()
             elif ver == 4:
                 self._migrate_4_to_5()
+            elif ver == 5:
+                self._migrate_5_to_6()
+            elif ver == 6:
+                self._migrate_6_to_7()
             else:
                 raise Exception(f'Missing SQLite migration from {ver} to {_DB_VERSION}')
 
@@ -129,6 +243,82 @@ class SQLiteStorage(Storage):
         cursor.execute('INSERT INTO Version VALUES (5)')
         self._connection().commit()
 
+    def _migrate_5_to_6(self):
+        cursor = self._connection().cursor()
+        cursor.execute("ALTER TABLE Record ADD COLUMN file_size INTEGER DEFAULT 0;")
+        cursor.execute("ALTER TABLE Record ADD COLUMN file_mtime REAL DEFAULT 0;")
+        cursor.execute("ALTER TABLE Record ADD COLUMN is_present INTEGER DEFAULT 0;")
+        cursor.execute("DELETE FROM Version")
+        cursor.execute('INSERT INTO Version VALUES (6)')
+        self._connection().commit()
+        self.refresh_files_state()
+
+    def _migrate_6_to_7(self):
+        cursor = self._connection().cursor()
+        cursor.execute('SELECT id, groups FROM Record')
+        for row in cursor.fetchall():
+            self._insert_groups(cursor, row[0], row[1].split(',') if row[1] else [])
+        cursor.execute("DELETE FROM Version")
+        cursor.execute('INSERT INTO Version VALUES (7)')
+        self._connection().commit()
+
+    def _create_indexes(self):
+        cursor = self._connection().cursor()
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_record_group_name ON RecordGroup(group_name)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_record_is_present ON Record(is_present)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_record_location ON Record(location)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_record_model_type ON Record(model_type)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_record_created_at ON Record(created_at)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_record_name ON Record(_name COLLATE NOCASE)')
+        self._connection().commit()
+        self._create_full_text_index()
+
+    def _create_full_text_index(self):
+        """
+        Creates FTS5 index over the searchable record columns, which is kept in sync by triggers. Index is rebuilt
+        whenever its triggers were missing, so the database stays usable by SQLite builds without FTS5.
+        :return: None
+        """
+        cursor = self._connection().cursor()
+        if not self.is_full_text_available:
+            # Triggers would break writes to Record table without the fts5 module.
+            cursor.execute('DROP TRIGGER IF EXISTS record_search_insert')
+            cursor.execute('DROP TRIGGER IF EXISTS record_search_delete')
+            cursor.execute('DROP TRIGGER IF EXISTS record_search_update')
+            self._connection().commit()
+            return
+
+        cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type='trigger' AND name LIKE 'record_search_%'")
+        if cursor.fetchone()[0] == 3:
+            return
+
+        columns = ', '.join(_SEARCH_COLUMNS)
+        new_values = ', '.join(f'new.{column}' for column in _SEARCH_COLUMNS)
+        old_values = ', '.join(f'old.{column}' for column in _SEARCH_COLUMNS)
+        cursor.execute(f'''CREATE VIRTUAL TABLE IF NOT EXISTS RecordSearch
+                                USING fts5({columns}, content='Record', content_rowid='id',
+                                tokenize='unicode61 remove_diacritics 2')''')
+        cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS record_search_insert AFTER INSERT ON Record BEGIN
+                                INSERT INTO RecordSearch(rowid, {columns}) VALUES (new.id, {new_values});
+                            END''')
+        cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS record_search_delete AFTER DELETE ON Record BEGIN
+                                INSERT INTO RecordSearch(RecordSearch, rowid, {columns})
+                                    VALUES ('delete', old.id, {old_values});
+                            END''')
+        cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS record_search_update AFTER UPDATE OF {columns} ON Record
+                            BEGIN
+                                INSERT INTO RecordSearch(RecordSearch, rowid, {columns})
+                                    VALUES ('delete', old.id, {old_values});
+                                INSERT INTO RecordSearch(rowid, {columns}) VALUES (new.id, {new_values});
+                            END''')
+        cursor.execute("INSERT INTO RecordSearch(RecordSearch) VALUES ('rebuild')")
+        self._connection().commit()
+
+    @staticmethod
+    def _insert_groups(cursor, record_id, groups: List):
+        cursor.executemany('INSERT OR IGNORE INTO RecordGroup(record_id, group_name) VALUES (?, ?)',
+                           [(record_id, group) for group in groups if group])
+
     def get_all_records(self) -> List:
         cursor = self._connection().cursor()
         cursor.execute('SELECT * FROM Record')
@@ -139,77 +329,72 @@ class SQLiteStorage(Storage):
         return result
 
     def query_records(self, name_query: str = None, groups=None, model_types=None, show_downloaded=True,
-                      show_not_downloaded=True) -> List:
-
-        query = 'SELECT * FROM Record'
-
-        is_where_appended = False
-        append_and = False
-
-        if name_query is not None and name_query:
-            if not is_where_appended:
-                query += ' WHERE'
-                is_where_appended = True
-
-            query += f" LOWER(_name) LIKE '%{name_query}%'"
-            append_and = True
-
-        if model_types is not None and len(model_types) > 0:
-            if not is_where_appended:
-                query += ' WHERE'
-                is_where_appended = True
-
-            if append_and:
-                query += ' AND'
-
-            query += ' ('
-            append_or = False
-            for model_type in model_types:
-                if append_or:
-                    query += ' OR'
-                query += f" model_type='{model_type}'"
-                append_or = True
+                      show_not_downloaded=True, full_text=False, sort_order: Optional[ModelSort] = None,
+                      sort_downloaded_first=False, limit: Optional[int] = None, offset=0) -> List:
+        if not show_downloaded and not show_not_downloaded:
+            return []
+
+        query = _QueryBuilder('SELECT * FROM Record')
+        if sort_downloaded_first:
+            query.order_by.append('is_present DESC')
+
+        if name_query and full_text:
+            tokens = _get_search_tokens(name_query)
+            if tokens and self.is_full_text_available:
+                query.select = f'''SELECT Record.* FROM Record JOIN
+                                (SELECT rowid, bm25(RecordSearch, {_SEARCH_RANK_WEIGHTS}) AS rank FROM RecordSearch
+                                    WHERE RecordSearch MATCH ?) AS search
+                                ON search.rowid=Record.id'''
+                query.select_params.append(_create_match_expression(tokens))
+                query.order_by.append('search.rank')
+                sort_order = None
+            else:
+                condition = '(' + ' OR '.join(f"{column} LIKE ? ESCAPE '\\'" for column in _SEARCH_COLUMNS) + ')'
+                for token in tokens:
+                    query.where(condition, *[f'%{_escape_like(token)}%'] * len(_SEARCH_COLUMNS))
+        elif name_query:
+            query.where("_name LIKE ? ESCAPE '\\'", f'%{_escape_like(name_query)}%')
 
-            query += ')'
+        if model_types:
+            query.where_in('model_type', model_types)
 
-            append_and = True
-            pass
+        if groups:
+            for group in groups:
+                query.where('id IN (SELECT record_id FROM RecordGroup WHERE group_name=?)', group)
 
-        if groups is not None and len(groups) > 0:
-            if not is_where_appended:
-                query += ' WHERE'
+        if show_downloaded != show_not_downloaded:
+            query.where('is_present=?', 1 if show_downloaded else 0)
 
-            for group in groups:
-                if append_and:
-                    query += ' AND'
-                query += f" LOWER(groups) LIKE '%{group}%'"
-                append_and = True
+        if sort_order is not None:
+            query.order_by.append(_SORT_ORDER_BY[sort_order])
+        query.limit = limit
+        query.offset = offset
 
-        logger.debug(f'query: {query}')
+        sql, params = query.build()
+        logger.debug(f'query: {sql}')
         cursor = self._connection().cursor()
-        cursor.execute(query)
+        cursor.execute(sql, params)
         rows = cursor.fetchall()
         result = []
         for row in rows:
-            record = map_row_to_record(row)
-            is_downloaded = bool(record.location) and os.path.exists(record.location)
-
-            if show_downloaded and is_downloaded:
-                result.append(record)
-            elif show_not_downloaded and not is_downloaded:
-                result.append(record)
-
+            result.append(map_row_to_record(row))
         return result
 
     def get_record_by_id(self, id_) -> Record:
         cursor = self._connection().cursor()
         cursor.execute('SELECT * FROM Record WHERE id=?', (id_,))
         row = cursor.fetchone()
-        return None if row is None else map_row_to_record(row)
+        if row is None:
+            return None
+        record = map_row_to_record(row)
+        # Stored state is only refreshed for watched directories, so a single record checks its file directly.
+        record.downloaded = None
+        return record
 
     def get_records_by_group(self, group: str) -> List:
         cursor = self._connection().cursor()
-        cursor.execute(f"SELECT * FROM Record WHERE LOWER(groups) LIKE '%{group}%'")
+        cursor.execute('SELECT * FROM Record WHERE id IN (SELECT record_id FROM RecordGroup WHERE group_name=?)',
+                       (group,))
         rows = cursor.fetchall()
         result = []
         for row in rows:
@@ -218,6 +403,22 @@ class SQLiteStorage(Storage):
 
     def add_record(self, record: Record):
         cursor = self._connection().cursor()
+        self._insert_record(cursor, record)
+        self._connection().commit()
+        self._changes += 1
+
+    def add_records(self, records: List):
+        cursor = self._connection().cursor()
+        try:
+            for record in records:
+                self._insert_record(cursor, record)
+            self._connection().commit()
+        except Exception:
+            self._connection().rollback()
+            raise
+        self._changes += 1
+
+    def _insert_record(self, cursor, record: Record):
         data = (
             record.name,
             record.model_type.value,
@@ -234,7 +435,8 @@ class SQLiteStorage(Storage):
             record.created_at,
             ",".join(record.groups),
             record.subdir,
-            record.location
+            record.location,
+            *_get_file_state(record.location)
         )
         cursor.execute(
             """INSERT INTO Record(
@@ -253,69 +455,120 @@ class SQLiteStorage(Storage):
                     created_at,
                     groups,
                     subdir,
-                    location) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                    location,
+                    file_size,
+                    file_mtime,
+                    is_present) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
             data)
-        self._connection().commit()
+        self._insert_groups(cursor, cursor.lastrowid, record.groups)
 
     def update_record(self, record: Record):
-        cursor = self._connection().cursor()
-        data = (
-            record.name,
-            record.model_type.value,
-            record.download_url,
-            record.url,
-            record.download_path,
-            record.download_filename,
-            record.preview_url,
-            record.description,
-            record.positive_prompts,
-            record.negative_prompts,
-            record.sha256_hash,
-            record.md5_hash,
-            ",".join(record.groups),
-            record.subdir,
-            record.location,
-            record.id_
-        )
-        cursor.execute(
-            """UPDATE Record SET 
-                    _name=?,
-                    model_type=?,
-                    download_url=?,
-                    url=?,
-                    download_path=?,
-                    download_filename=?,
-                    preview_url=?,
-                    description=?,
-                    positive_prompts=?,
-                    negative_prompts=?,
-                    sha256_hash=?,
-                    md5_hash=?,
-                    groups=?,
-                    subdir=?,
-                    location=?
-                WHERE id=?
-            """, data
-        )
+        self.update_records([record])
+
+    def update_records(self, records: List):
+        data = []
+        for record in records:
+            data.append((
+                record.name,
+                record.model_type.value,
+                record.download_url,
+                record.url,
+                record.download_path,
+                record.download_filename,
+                record.preview_url,
+                record.description,
+                record.positive_prompts,
+                record.negative_prompts,
+                record.sha256_hash,
+                record.md5_hash,
+                ",".join(record.groups),
+                record.subdir,
+                record.location,
+                *_get_file_state(record.location),
+                record.id_
+            ))
 
-        self._connection().commit()
+        cursor = self._connection().cursor()
+        try:
+            cursor.executemany(
+                """UPDATE Record SET 
+                        _name=?,
+                        model_type=?,
+                        download_url=?,
+                        url=?,
+                        download_path=?,
+                        download_filename=?,
+                        preview_url=?,
+                        description=?,
+                        positive_prompts=?,
+                        negative_prompts=?,
+                        sha256_hash=?,
+                        md5_hash=?,
+                        groups=?,
+                        subdir=?,
+                        location=?,
+                        file_size=?,
+                        file_mtime=?,
+                        is_present=?
+                    WHERE id=?
+                """, data
+            )
+
+            cursor.executemany('DELETE FROM RecordGroup WHERE record_id=?', [(record.id_,) for record in records])
+            cursor.executemany('INSERT OR IGNORE INTO RecordGroup(record_id, group_name) VALUES (?, ?)',
+                               [(record.id_, group) for record in records for group in record.groups if group])
+            self._connection().commit()
+        except Exception:
+            self._connection().rollback()
+            raise
+        self._changes += 1
 
     def remove_record(self, _id):
+        self.remove_records([_id])
+
+    def remove_records(self, ids: List):
         cursor = self._connection().cursor()
-        cursor.execute("DELETE FROM Record WHERE id=?", (_id,))
-        self._connection().commit()
+        try:
+            cursor.executemany("DELETE FROM Record WHERE id=?", [(id_,) for id_ in ids])
+            cursor.executemany("DELETE FROM RecordGroup WHERE record_id=?", [(id_,) for id_ in ids])
+            self._connection().commit()
+        except Exception:
+            self._connection().rollback()
+            raise
+        self._changes += 1
 
     def get_available_groups(self) -> List:
         cursor = self._connection().cursor()
-        cursor.execute('SELECT groups FROM Record')
-        rows = cursor.fetchall()
-        result = []
-        for row in rows:
-            if row[0]:
-                result.extend(row[0].split(","))
+        cursor.execute('SELECT DISTINCT group_name FROM RecordGroup')
+        return [row[0] for row in cursor.fetchall()]
+
+    def update_files_state(self, locations: List):
+        cursor = self._connection().cursor()
+        cursor.executemany('UPDATE Record SET file_size=?, file_mtime=?, is_present=? WHERE location=?',
+                           [(*_get_file_state(location), location) for location in locations])
+        self._connection().commit()
+        # Most watched files aren't bound to records, change token is kept for them.
+        if cursor.rowcount > 0:
+            self._changes += 1
+
+    def refresh_files_state(self):
+        cursor = self._connection().cursor()
+        cursor.execute('SELECT * FROM Record')
+        records = [map_row_to_record(row) for row in cursor.fetchall()]
+        resolve_downloaded_state(records)
+
+        data = []
+        for record in records:
+            if record.downloaded:
+                data.append((*_get_file_state(record.location), record.id_))
+            else:
+                data.append((0, 0, 0, record.id_))
+        cursor.executemany('UPDATE Record SET file_size=?, file_mtime=?, is_present=? WHERE id=?', data)
+        self._connection().commit()
+        self._changes += 1
 
-        result = list(set(result))
-        return list(filter(None, result))
+    def get_change_token(self) -> Optional[str]:
+        return f'{self._session}-{self._changes}'
 
     def get_all_records_locations(self) -> List:
         cursor = self._connection().cursor()
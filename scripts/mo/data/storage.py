@@ -1,7 +1,8 @@
 from abc import ABC, abstractmethod
-from typing import Dict, List
+from typing import Dict, List, Optional
 
-from scripts.mo.models import Record, ModelType
+from scripts.mo.data.downloaded_state import resolve_downloaded_state
+from scripts.mo.models import Record, ModelType, ModelSort
 
 
 def map_dict_to_record(id_, raw: Dict) -> Record:
@@ -48,6 +49,39 @@ def map_record_to_dict(record: Record) -> dict:
     }
 
 
+def sort_records(records: List, sort_order: Optional[ModelSort], sort_downloaded_first: bool) -> List:
+    """
+    Sorts records in the same order as storages do. Names are compared case-insensitively.
+    :param records: records to sort.
+    :param sort_order: sort order, records order is kept if None.
+    :param sort_downloaded_first: puts records with existing files first.
+    :return: new sorted records list.
+    """
+    if sort_order is None:
+        sorted_records = list(records)
+    elif sort_order == ModelSort.TIME_ADDED_ASC:
+        sorted_records = sorted(records, key=lambda record: record.created_at)
+    elif sort_order == ModelSort.TIME_ADDED_DESC:
+        sorted_records = sorted(records, key=lambda record: record.created_at, reverse=True)
+    elif sort_order == ModelSort.NAME_ASC:
+        sorted_records = sorted(records, key=lambda record: record.name.lower())
+    elif sort_order == ModelSort.NAME_DESC:
+        sorted_records = sorted(records, key=lambda record: record.name.lower(), reverse=True)
+    else:
+        raise ValueError(f'An unhandled sort_order value: {sort_order.value}')
+
+    if sort_downloaded_first:
+        resolve_downloaded_state([record for record in sorted_records if record.downloaded is None])
+        sorted_records.sort(key=lambda record: not record.is_file_exists())
+    return sorted_records
+
+
+def slice_records(records: List, limit: Optional[int], offset: int) -> List:
+    if limit is None:
+        return records[offset:]
+    return records[offset:offset + limit]
+
+
 class Storage(ABC):
 
     @abstractmethod
@@ -56,7 +90,13 @@ class Storage(ABC):
 
     @abstractmethod
     def query_records(self, name_query=None, groups=None, model_types=None, show_downloaded=None,
-                      show_not_downloaded=None) -> List:
+                      show_not_downloaded=None, full_text=False, sort_order: Optional[ModelSort] = None,
+                      sort_downloaded_first=False, limit: Optional[int] = None, offset=0) -> List:
+        """
+        Queries records matching filters. Full-text results are ordered by relevance and sort_order is ignored for
+        them.
+        :return: page of records list in the requested order.
+        """
         pass
 
     @abstractmethod
@@ -67,14 +107,41 @@ class Storage(ABC):
     def add_record(self, record: Record):
         pass
 
+    def add_records(self, records: List):
+        """
+        Adds records at once, storages that support batch writes override it.
+        :param records: records to add.
+        :return: None
+        """
+        for record in records:
+            self.add_record(record)
+
     @abstractmethod
     def update_record(self, record: Record):
         pass
 
+    def update_records(self, records: List):
+        """
+        Updates records at once, storages that support batch writes override it.
+        :param records: records to update.
+        :return: None
+        """
+        for record in records:
+            self.update_record(record)
+
     @abstractmethod
     def remove_record(self, _id):
         pass
 
+    def remove_records(self, ids: List):
+        """
+        Removes records at once, storages that support batch writes override it.
+        :param ids: ids of records to remove.
+        :return: None
+        """
+        for id_ in ids:
+            self.remove_record(id_)
+
     @abstractmethod
     def get_available_groups(self) -> List:
         pass
@@ -86,3 +153,32 @@ class Storage(ABC):
     @abstractmethod
     def get_all_records_locations(self) -> List:
         pass
+
+    def update_files_state(self, locations: List):
+        """
+        Saves current state of model files bound to records. Storages that don't keep files state ignore it.
+        :param locations: changed model files paths.
+        :return: None
+        """
+        pass
+
+    def refresh_files_state(self):
+        """
+        Verifies files state of all records. Storages that don't keep files state ignore it.
+        :return: None
+        """
+        pass
+
+    def invalidate(self):
+        """
+        Drops records cached in memory, so they are loaded again on the next read. Storages without cache ignore it.
+        :return: None
+        """
+        pass
+
+    def get_change_token(self) -> Optional[str]:
+        """
+        Returns token that is changed whenever stored records are changed.
+        :return: token string or None if storage can't track changes.
+        """
+        return None
@@ -0,0 +1,45 @@
+import hashlib
+
+_READ_SIZE = 1024 * 1024  # 1MB
+
+
+class DownloadHasher:
+    """
+    Calculates MD5 and SHA256 of a file while it is being downloaded, so the file doesn't have to be read again.
+    Data must be passed in file order.
+    """
+
+    def __init__(self):
+        self._md5 = hashlib.md5()
+        self._sha256 = hashlib.sha256()
+        self.bytes_hashed = 0
+
+    def update(self, data):
+        self._md5.update(data)
+        self._sha256.update(data)
+        self.bytes_hashed += len(data)
+
+    def update_from_file(self, file_path: str, end: int):
+        """
+        Hashes file content from the current hashed position up to the end offset. Used for the already downloaded
+        part of resumed files and for segments that were written out of order.
+        :param file_path: path to the file being downloaded.
+        :param end: offset to hash file content up to.
+        :return: None
+        """
+        if end <= self.bytes_hashed:
+            return
+
+        with open(file_path, 'rb') as file:
+            file.seek(self.bytes_hashed)
+            while self.bytes_hashed < end:
+                data = file.read(min(_READ_SIZE, end - self.bytes_hashed))
+                if not data:
+                    break
+                self.update(data)
+
+    def digests(self) -> dict:
+        return {
+            'md5': self._md5.hexdigest(),
+            'sha256': self._sha256.hexdigest()
+        }
@@ -1,16 +1,23 @@
 import os
 import tempfile
 import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
 from typing import List
 from urllib.parse import urlparse
 
+from scripts.mo.data.file_watcher import FileWatcher
+from scripts.mo.data.hash_index import HashIndex
+from scripts.mo.data.preview_resolver import PreviewResolver
 from scripts.mo.dl.downloader import Downloader
 from scripts.mo.dl.gdrive_downloader import GDriveDownloader
 from scripts.mo.dl.http_downloader import HttpDownloader
-from scripts.mo.environment import env, logger, calculate_md5
+from scripts.mo.dl.partial_file import get_partial_file_path, remove_manifest
+from scripts.mo.environment import env, logger
 from scripts.mo.models import Record
-from scripts.mo.utils import resize_preview_image, get_model_filename_without_extension, calculate_sha256
+from scripts.mo.thumbnails import ThumbnailWarmer
+from scripts.mo.utils import resize_preview_image, get_model_filename_without_extension
 
 GENERAL_STATUS_IN_PROGRESS = 'In Progress'
 GENERAL_STATUS_CANCELLED = 'Cancelled'
@@ -24,6 +31,10 @@ RECORD_STATUS_EXISTS = 'Exists'
 RECORD_STATUS_ERROR = 'Error'
 RECORD_STATUS_CANCELLED = 'Cancelled'
 
+# Downloaded records are saved to storage in batches, a batch is written when it's full or every interval.
+_UPDATE_BATCH_SIZE = 20
+_UPDATE_BATCH_INTERVAL = 2
+
 
 def _get_destination_dir_path(record: Record) -> str:
     path = record.download_path
@@ -33,8 +44,8 @@ def _get_destination_dir_path(record: Record) -> str:
             raise Exception(f'Destination path is undefined.')
 
     path = os.path.join(path, record.subdir)
-    if not os.path.isdir(path):
-        os.makedirs(path)
+    # Records of the same new subdir are downloaded at the same time, so the directory could be created meanwhile.
+    os.makedirs(path, exist_ok=True)
 
     return path
 
@@ -54,6 +65,11 @@ def _get_filename_from_url(url):
     return filename + extension
 
 
+def _get_host(url) -> str:
+    hostname = urlparse(url).hostname
+    return hostname if hostname else ''
+
+
 def _get_filename(downloader: Downloader, record: Record) -> str:
     if record.download_filename:
         filename = record.download_filename
@@ -88,8 +104,17 @@ class DownloadManager:
 
         self._state = {}
         self._latest_state = {}
+        self._state_lock = threading.Lock()
+        self._scheduler_condition = threading.Condition()
         self._thread = None
         self._temp_files = set()
+        self._active_destinations = {}
+        self._destinations_condition = threading.Condition()
+
+        self._pending_updates = []
+        self._pending_updates_condition = threading.Condition()
+        self._pending_updates_flushed_at = time.time()
+        self._flush_stop_event = threading.Event()
 
         self._downloaders: List = [
             GDriveDownloader(),
@@ -111,7 +136,10 @@ class DownloadManager:
         return self._state
 
     def get_latest_state(self) -> dict:
-        return self._latest_state
+        with self._state_lock:
+            latest_state = self._latest_state
+            self._latest_state = {}
+        return latest_state
 
     def start_download(self, records: List):
         if not self._stop_event.is_set():
@@ -119,6 +147,8 @@ class DownloadManager:
             return
 
         self._stop_event.clear()
+        with self._pending_updates_condition:
+            self._pending_updates_flushed_at = time.time()
         self._state = {}
         self._latest_state = {}
         self._state_update(general_status=GENERAL_STATUS_IN_PROGRESS)
@@ -134,50 +164,63 @@ class DownloadManager:
         self._thread.join()
 
     def _state_update(self, general_status=None, exception=None, record_id=None, record_state=None):
-        new_general_state = deepcopy(self._state)
+        with self._state_lock:
+            new_general_state = deepcopy(self._state)
 
-        latest_state = {}
+            latest_state = self._latest_state
 
-        if general_status is not None:
-            new_general_state['general_status'] = general_status
-            latest_state['general_status'] = general_status
+            if general_status is not None:
+                new_general_state['general_status'] = general_status
+                latest_state['general_status'] = general_status
 
-        if exception is not None:
-            new_general_state['exception'] = str(exception)
-            latest_state['exception'] = str(exception)
+            if exception is not None:
+                new_general_state['exception'] = str(exception)
+                latest_state['exception'] = str(exception)
 
-        if record_id is not None and record_state is not None:
-            if new_general_state.get('records') is None:
-                new_general_state['records'] = {}
+            if record_id is not None and record_state is not None:
+                if new_general_state.get('records') is None:
+                    new_general_state['records'] = {}
 
-            if new_general_state['records'].get(record_id) is None:
-                new_general_state['records'][record_id] = record_state
-            else:
-                new_general_state['records'][record_id].update(record_state)
+                if new_general_state['records'].get(record_id) is None:
+                    new_general_state['records'][record_id] = record_state
+                else:
+                    new_general_state['records'][record_id].update(record_state)
 
-            latest_state['records'] = {record_id: record_state}
+                if latest_state.get('records') is None:
+                    latest_state['records'] = {}
 
-        if general_status == GENERAL_STATUS_CANCELLED and new_general_state.get('records') is not None:
-            for key, value in new_general_state['records'].items():
-                if value.get('status') and \
-                        (value['status'] == RECORD_STATUS_PENDING or value['status'] == RECORD_STATUS_IN_PROGRESS):
-                    value['status'] = RECORD_STATUS_CANCELLED
+                if latest_state['records'].get(record_id) is None:
+                    latest_state['records'][record_id] = dict(record_state)
+                else:
+                    latest_state['records'][record_id].update(record_state)
 
-        self._state = new_general_state
-        self._latest_state = latest_state
+            if general_status == GENERAL_STATUS_CANCELLED and new_general_state.get('records') is not None:
+                for key, value in new_general_state['records'].items():
+                    if value.get('status') and \
+                            (value['status'] == RECORD_STATUS_PENDING or value['status'] == RECORD_STATUS_IN_PROGRESS):
+                        value['status'] = RECORD_STATUS_CANCELLED
+
+            self._state = new_general_state
+            self._latest_state = latest_state
 
     def _download_loop(self, records: List):
         try:
             self._clear_temp_files()
-            for record in records:
-                for upd in self._download_record(record):
-                    self._state_update(record_id=record.id_, record_state=upd)
-
-                    if self._stop_event.is_set():
-                        break
+            self._flush_stop_event.clear()
+            flush_thread = threading.Thread(target=self._flush_loop, name='mo-download-flush', daemon=True)
+            flush_thread.start()
+            try:
+                self._schedule_downloads(records)
+            finally:
+                with self._pending_updates_condition:
+                    self._flush_stop_event.set()
+                    self._pending_updates_condition.notify_all()
+                flush_thread.join()
+            # Errors of the last flush fail the whole download session, records files are complete anyway.
+            self._flush_record_updates()
 
             exception = None
-            for key, value in self._state['records'].items():
+            for key, value in self._state.get('records', {}).items():
                 if value.get('exception') is not None:
                     exception = value['exception']
                     break
@@ -197,6 +240,83 @@ class DownloadManager:
         self._stop_event.set()
         self._running = False
 
+    def _schedule_downloads(self, records: List):
+        """
+        Runs records downloads in a bounded worker pool. A record is started only when both overall and per host
+        limits allow it, so records from other hosts are not blocked behind a busy one.
+        """
+        max_workers = max(1, int(env.download_concurrency()))
+        max_per_host = max(1, int(env.download_host_concurrency()))
+
+        pending = []
+        scheduled_ids = set()
+        for record in records:
+            if record.id_ not in scheduled_ids:
+                scheduled_ids.add(record.id_)
+                pending.append(record)
+
+        active_hosts = {}
+        futures = []
+
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='mo-download') as executor:
+            with self._scheduler_condition:
+                while pending and not self._stop_event.is_set():
+                    record = None
+                    if sum(active_hosts.values()) < max_workers:
+                        for candidate in pending:
+                            if active_hosts.get(_get_host(candidate.download_url), 0) < max_per_host:
+                                record = candidate
+                                break
+
+                    if record is None:
+                        self._scheduler_condition.wait(0.5)
+                        continue
+
+                    pending.remove(record)
+                    host = _get_host(record.download_url)
+                    active_hosts[host] = active_hosts.get(host, 0) + 1
+                    futures.append(executor.submit(self._download_worker, record, host, active_hosts))
+
+        for future in futures:
+            future.result()
+
+    def _download_worker(self, record: Record, host: str, active_hosts: dict):
+        try:
+            for upd in self._download_record(record):
+                self._state_update(record_id=record.id_, record_state=upd)
+
+                if self._stop_event.is_set():
+                    break
+        finally:
+            self._release_destinations(record)
+            with self._scheduler_condition:
+                active_hosts[host] -= 1
+                self._scheduler_condition.notify_all()
+
+    def _claim_destination(self, record: Record, destination_file_path: str) -> bool:
+        """
+        Reserves destination file for the record download. Records with the same destination share the partial file,
+        so the record waits while another one downloads into it.
+        :param record: record to download.
+        :param destination_file_path: destination file path.
+        :return: True if destination is reserved, False if download was stopped while waiting.
+        """
+        key = os.path.normcase(os.path.abspath(destination_file_path))
+        with self._destinations_condition:
+            while key in self._active_destinations:
+                if self._stop_event.is_set():
+                    return False
+                logger.debug('Waiting for another download into: %s', destination_file_path)
+                self._destinations_condition.wait(0.5)
+            self._active_destinations[key] = record.id_
+            return True
+
+    def _release_destinations(self, record: Record):
+        with self._destinations_condition:
+            for key in [key for key, id_ in self._active_destinations.items() if id_ == record.id_]:
+                del self._active_destinations[key]
+            self._destinations_condition.notify_all()
+
     def _download_record(self, record: Record):
         try:
             yield {'status': RECORD_STATUS_IN_PROGRESS}
@@ -221,6 +341,9 @@ class DownloadManager:
 
             yield {'destination': destination_file_path}
 
+            if not self._claim_destination(record, destination_file_path):
+                return
+
             if os.path.exists(destination_file_path):
                 logger.debug('File already exists')
                 yield {'status': RECORD_STATUS_EXISTS}
@@ -229,35 +352,39 @@ class DownloadManager:
             if self._stop_event.is_set():
                 return
 
-            with tempfile.NamedTemporaryFile(delete=False, dir=destination_dir) as temp:
-                logger.debug('Downloading into tmp file: %s', temp.name)
-                self._temp_files.add(temp)
-                for upd in downloader.download(record.download_url, temp.name, filename, self._stop_event):
-                    yield {'dl': upd}
-
-                temp.close()
+            partial_file_path = get_partial_file_path(destination_file_path)
+            logger.debug('Downloading into partial file: %s', partial_file_path)
+            digests = {}
+            for upd in downloader.download(record.download_url, partial_file_path, filename, self._stop_event,
+                                           resume=True):
+                if upd.get('sha256') is not None:
+                    digests = {'md5': upd.pop('md5'), 'sha256': upd.pop('sha256')}
+                yield {'dl': upd}
 
-                if self._stop_event.is_set():
-                    return
+            if self._stop_event.is_set():
+                return
 
-                os.rename(temp.name, destination_file_path)
-                self._temp_files.remove(temp)
-                os.chmod(destination_file_path, 0o644)
-                logger.debug('Move from tmp file to destination: %s', destination_file_path)
+            os.rename(partial_file_path, destination_file_path)
+            remove_manifest(partial_file_path)
+            os.chmod(destination_file_path, 0o644)
+            logger.debug('Move from partial file to destination: %s', destination_file_path)
+            FileWatcher.instance().refresh_path(destination_file_path)
 
             record.location = destination_file_path
-            record.md5_hash = calculate_md5(destination_file_path)
-            record.sha256_hash = calculate_sha256(destination_file_path)
+            if digests:
+                HashIndex.instance().put(destination_file_path, digests['sha256'], digests['md5'])
+            else:
+                digests = HashIndex.instance().get_hashes(destination_file_path)
+            record.md5_hash = digests['md5']
+            record.sha256_hash = digests['sha256']
 
-            env.storage.update_record(record)
+            self._queue_record_update(record)
 
         except Exception as ex:
             yield {'status': RECORD_STATUS_ERROR, 'exception': ex}
             logger.exception(ex)
             return
 
-        self._clear_temp_files()
-
         if self._stop_event.is_set():
             return
 
@@ -283,23 +410,69 @@ class DownloadManager:
                 with tempfile.NamedTemporaryFile(dir=destination_dir, delete=False) as temp:
                     logger.debug('Downloading preview into tmp file: %s', temp.name)
                     self._temp_files.add(temp)
-                    for upd in preview_downloader.download(record.preview_url, temp.name, preview_filename,
-                                                           self._stop_event):
-                        yield {'preview_dl': upd}
-
-                    if self._stop_event.is_set():
-                        return
+                    try:
+                        for upd in preview_downloader.download(record.preview_url, temp.name, preview_filename,
+                                                               self._stop_event):
+                            yield {'preview_dl': upd}
+
+                        if self._stop_event.is_set():
+                            return
+
+                        resize_preview_image(temp.name, preview_destination_file_path)
+                        FileWatcher.instance().refresh_path(preview_destination_file_path)
+                        PreviewResolver.instance().invalidate(preview_destination_file_path)
+                        ThumbnailWarmer.instance().submit(preview_destination_file_path)
+
+                        logger.debug('Move from tmp file to preview destination: %s', preview_destination_file_path)
+                    finally:
+                        self._release_temp_file(temp)
+            except Exception as ex:
+                yield {'exception_preview': ex}
+                logger.exception(ex)
 
-                    resize_preview_image(temp.name, preview_destination_file_path)
+        yield {'status': RECORD_STATUS_COMPLETED}
 
-                    logger.debug('Move from tmp file to preview destination: %s', preview_destination_file_path)
+    def _queue_record_update(self, record: Record):
+        with self._pending_updates_condition:
+            self._pending_updates.append(record)
+            if len(self._pending_updates) >= _UPDATE_BATCH_SIZE:
+                self._pending_updates_condition.notify_all()
+
+    def _flush_loop(self):
+        """
+        Saves queued records while downloads are running, records are saved at least every _UPDATE_BATCH_INTERVAL
+        seconds. Failed records are kept for the next flush, so errors don't change records download status.
+        """
+        while True:
+            with self._pending_updates_condition:
+                if self._flush_stop_event.is_set():
+                    return
+                timeout = self._pending_updates_flushed_at + _UPDATE_BATCH_INTERVAL - time.time()
+                if timeout > 0 and len(self._pending_updates) < _UPDATE_BATCH_SIZE:
+                    self._pending_updates_condition.wait(timeout)
+                if self._flush_stop_event.is_set():
+                    return
+            try:
+                self._flush_record_updates()
             except Exception as ex:
-                yield {'exception_preview': ex}
                 logger.exception(ex)
 
-            self._clear_temp_files()
+    def _flush_record_updates(self):
+        with self._pending_updates_condition:
+            records = self._pending_updates
+            self._pending_updates = []
+            self._pending_updates_flushed_at = time.time()
+        if not records:
+            return
 
-        yield {'status': RECORD_STATUS_COMPLETED}
+        logger.debug('Saving %d downloaded records', len(records))
+        try:
+            env.storage.update_records(records)
+        except Exception:
+            # Records are kept for the next flush, the last one runs when all downloads are finished.
+            with self._pending_updates_condition:
+                self._pending_updates = records + self._pending_updates
+            raise
 
     def _get_downloader(self, url: str) -> Downloader:
         for downloader in self._downloaders:
@@ -313,13 +486,17 @@ class DownloadManager:
                 return True
         return False
 
+    def _release_temp_file(self, temp_file):
+        self._temp_files.discard(temp_file)
+        try:
+            if temp_file:
+                temp_file.close()
+            if os.path.exists(temp_file.name):
+                os.remove(temp_file.name)
+        except Exception as ex:
+            logger.warning(f'Failed to remove temp_file: {temp_file.name}')
+            logger.exception(ex)
+
     def _clear_temp_files(self):
-        for temp_file in self._temp_files:
-            try:
-                if temp_file:
-                    temp_file.close()
-                if os.path.exists(temp_file.name):
-                    os.remove(temp_file.name)
-            except Exception as ex:
-                logger.warning(f'Failed to remove temp_file: {temp_file.name}')
-                logger.exception(ex)
+        for temp_file in list(self._temp_files):
+            self._release_temp_file(temp_file)
@@ -35,7 +35,9 @@ import requests
 import tqdm
 from bs4 import BeautifulSoup
 
+from scripts.mo.dl.download_hasher import DownloadHasher
 from scripts.mo.dl.downloader import Downloader
+from scripts.mo.dl.partial_file import read_manifest, write_manifest, is_manifest_valid
 from scripts.mo.environment import logger
 
 CHUNK_SIZE = 512 * 1024  # 512KB
@@ -148,6 +150,7 @@ def _download(
         resume=False,
 ):
     url_origin = url
+    url_origin_input = url
 
     yield {'bytes_ready': 0, 'bytes_total': 0, 'speed_rate': 0, 'elapsed': 0}
 
@@ -187,8 +190,7 @@ def _download(
             return
 
         if use_cookies:
-            if not osp.exists(osp.dirname(cookies_file)):
-                os.makedirs(osp.dirname(cookies_file))
+            os.makedirs(osp.dirname(cookies_file), exist_ok=True)
             # Save cookies
             with open(cookies_file, "w") as f:
                 cookies = [
@@ -242,36 +244,55 @@ def _download(
         output = osp.join(output, filename_from_url)
 
     if output_is_path:
-        existing_tmp_files = []
-        for file in os.listdir(osp.dirname(output) or "."):
-            if file.startswith(osp.basename(output)):
-                existing_tmp_files.append(osp.join(osp.dirname(output), file))
-        if resume and existing_tmp_files:
-            if len(existing_tmp_files) != 1:
-                logger.warning("There are multiple temporary files to resume:")
-                logger.warning("\n")
-                for file in existing_tmp_files:
-                    logger.warning(f"\t{file}")
-                logger.warning("\n")
-                logger.warning("Please remove them except one to resume downloading.")
-                return
-            tmp_file = existing_tmp_files[0]
-        else:
+        tmp_file = output
+        is_resume_requested = resume
+        # Partial file is resumed only when the remote file has the same validators and size as when it was started.
+        etag = res.headers.get("ETag")
+        last_modified = res.headers.get("Last-Modified")
+        bytes_total = res.headers.get("Content-Length")
+        bytes_total = int(bytes_total) if bytes_total is not None else None
+        manifest = read_manifest(tmp_file) if resume else None
+        if resume and not is_manifest_valid(manifest, url_origin_input, etag, last_modified):
             resume = False
-            # mkstemp is preferred, but does not work on Windows
-            # https://github.com/wkentaro/gdown/issues/153
-            tmp_file = output
-        f = open(tmp_file, "ab")
+        elif resume and bytes_total is not None and \
+                (manifest.get('bytes_total', bytes_total) != bytes_total or osp.getsize(tmp_file) > bytes_total):
+            logger.debug(f'Remote file size is changed, start over: {tmp_file}')
+            resume = False
+        f = open(tmp_file, "ab" if resume else "wb")
+        if is_resume_requested:
+            write_manifest(tmp_file, {
+                'url': url_origin_input,
+                'etag': etag,
+                'last_modified': last_modified,
+                'bytes_total': bytes_total
+            })
     else:
+        resume = False
         tmp_file = None
         f = output
 
     if stop_event.is_set():
         return
 
+    offset = 0
     if tmp_file is not None and f.tell() != 0:
+        res.close()
         headers = {"Range": "bytes={}-".format(f.tell())}
+        validator = etag or last_modified
+        if validator:
+            headers["If-Range"] = validator
         res = sess.get(url, headers=headers, stream=True, verify=verify)
+        if res.status_code == 206:
+            offset = f.tell()
+        else:
+            # Server ignored the range, start over.
+            resume = False
+            f.seek(0)
+            f.truncate()
+
+    hasher = DownloadHasher()
+    if offset > 0:
+        hasher.update_from_file(tmp_file, offset)
 
     if stop_event.is_set():
         return
@@ -291,18 +312,19 @@ def _download(
 
     total = res.headers.get("Content-Length")
     try:
-        yield {'bytes_ready': 0, 'bytes_total': total, 'speed_rate': 0, 'elapsed': 0}
-
         if total is not None:
-            total = int(total)
+            total = offset + int(total)
+
+        yield {'bytes_ready': offset, 'bytes_total': total, 'speed_rate': 0, 'elapsed': 0}
 
-        pbar = tqdm.tqdm(total=total, unit="iB", unit_scale=True, desc=description)
+        pbar = tqdm.tqdm(total=total, initial=offset, unit="iB", unit_scale=True, desc=description)
 
         if stop_event.is_set():
             return
 
         for chunk in res.iter_content(chunk_size=CHUNK_SIZE):
             f.write(chunk)
+            hasher.update(chunk)
 
             if stop_event.is_set():
                 return
@@ -323,12 +345,14 @@ def _download(
             if tmp_file != output:
                 shutil.move(tmp_file, output)
 
-        yield {
+        result = {
             'bytes_ready': total,
             'bytes_total': total,
             'speed_rate': 0,
             'elapsed': 0
         }
+        result.update(hasher.digests())
+        yield result
     finally:
         sess.close()
 
@@ -369,8 +393,10 @@ class GDriveDownloader(Downloader):
         else:
             return None
 
-    def download(self, url: str, destination_file: str, description: str, stop_event: threading.Event):
+    def download(self, url: str, destination_file: str, description: str, stop_event: threading.Event,
+                 resume: bool = False):
         yield from _download(url=url,
                              output=destination_file,
                              description=description,
-                             stop_event=stop_event)
+                             stop_event=stop_event,
+                             resume=resume)
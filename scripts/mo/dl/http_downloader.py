@@ -1,10 +1,49 @@
+import os
+import re
 import threading
+import time
 from urllib.parse import urlparse
 
 import requests
 from tqdm import tqdm
 
+from scripts.mo.dl.download_hasher import DownloadHasher
 from scripts.mo.dl.downloader import Downloader
+from scripts.mo.dl.partial_file import read_manifest, write_manifest, is_manifest_valid
+from scripts.mo.environment import env, logger
+
+_SEGMENTED_MIN_SIZE = 32 * 1024 * 1024  # 32MB
+_CHUNK_SIZE = 1024 * 1024  # 1MB
+# Segments are taken by connections in file order, so the hashed prefix stays close to the downloaded data.
+_SEGMENT_SIZE = 16 * 1024 * 1024  # 16MB
+_PROGRESS_INTERVAL = 0.2
+_JOIN_TIMEOUT = 5
+_MANIFEST_SAVE_INTERVAL = 1
+
+
+def _parse_content_range_total(content_range):
+    if not content_range:
+        return None
+    match = re.match(r'^bytes\s+\d+-\d+/(\d+)$', content_range.strip())
+    if match:
+        return int(match.group(1))
+    return None
+
+
+def _contiguous_bytes(segments) -> int:
+    result = 0
+    for start, end, done in segments:
+        result += done
+        if start + done <= end:
+            break
+    return result
+
+
+def _split_ranges(total_size, segment_size):
+    ranges = []
+    for start in range(0, total_size, segment_size):
+        ranges.append((start, min(start + segment_size, total_size) - 1))
+    return ranges
 
 
 class HttpDownloader(Downloader):
@@ -24,35 +63,141 @@ class HttpDownloader(Downloader):
         else:
             return None
 
-    def download(self, url: str, destination_file: str, description: str, stop_event: threading.Event):
+    def download(self, url: str, destination_file: str, description: str, stop_event: threading.Event,
+                 resume: bool = False):
         if stop_event.is_set():
             return
 
         yield {'bytes_ready': 'None', 'bytes_total': 'None', 'speed_rate': 'None', 'elapsed': 'None'}
 
-        response = requests.get(url, stream=True)
-        total_size = int(response.headers.get('content-length', 0))
+        manifest = read_manifest(destination_file) if resume else None
+        is_segmented_resume = manifest is not None and bool(manifest.get('segments'))
+
+        connections = max(1, int(env.download_segments()))
+        if connections > 1 or is_segmented_resume:
+            probe = self._probe_ranges(url)
+            if probe is not None and probe['bytes_total'] >= _SEGMENTED_MIN_SIZE:
+                if is_segmented_resume and manifest.get('bytes_total') == probe['bytes_total'] and \
+                        is_manifest_valid(manifest, url, probe['etag'], probe['last_modified']):
+                    logger.debug('Resume segmented download: %s', destination_file)
+                else:
+                    manifest = {
+                        'url': url,
+                        'etag': probe['etag'],
+                        'last_modified': probe['last_modified'],
+                        'bytes_total': probe['bytes_total'],
+                        'segments': [[start, end, 0] for start, end in
+                                     _split_ranges(probe['bytes_total'], _SEGMENT_SIZE)]
+                    }
+                    with open(destination_file, 'wb') as file:
+                        file.truncate(probe['bytes_total'])
+
+                logger.debug('Segmented download with %s connections: %s', connections, probe['url'])
+                yield from self._download_segmented(probe['url'], destination_file, description, stop_event,
+                                                    manifest, connections, resume)
+                return
+
+        if is_segmented_resume:
+            manifest = None
+
+        yield from self._download_single(url, destination_file, description, stop_event, manifest, resume)
+
+    @staticmethod
+    def _probe_ranges(url):
+        """
+        Checks server supports byte ranges requests.
+        :param url: file url.
+        :return: dictionary with url after redirects, file size and validators or None if ranges are not supported.
+        """
+        try:
+            with requests.get(url, headers={'Range': 'bytes=0-0'}, stream=True) as response:
+                if response.status_code != 206:
+                    return None
+                if response.headers.get('Accept-Ranges', 'bytes').lower() == 'none':
+                    return None
+                total_size = _parse_content_range_total(response.headers.get('Content-Range'))
+                if total_size is None:
+                    return None
+                return {
+                    'url': response.url,
+                    'bytes_total': total_size,
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified')
+                }
+        except requests.RequestException as ex:
+            logger.warning(f'Range probe failed, fallback to single connection: {ex}')
+            return None
 
-        yield {'bytes_ready': 0, 'bytes_total': total_size, 'speed_rate': 0, 'elapsed': 0}
+    def _download_single(self, url: str, destination_file: str, description: str, stop_event: threading.Event,
+                         manifest=None, save_manifest=False):
+        offset = 0
+        headers = {}
+        if is_manifest_valid(manifest, url) and os.path.isfile(destination_file):
+            offset = os.path.getsize(destination_file)
+
+        if offset > 0:
+            headers['Range'] = f'bytes={offset}-'
+            validator = manifest.get('etag') or manifest.get('last_modified')
+            if validator:
+                headers['If-Range'] = validator
+
+        response = requests.get(url, headers=headers, stream=True)
+
+        if offset > 0 and response.status_code == 416:
+            response.close()
+            if manifest.get('bytes_total') == offset:
+                logger.debug('Partial file is already complete: %s', destination_file)
+                hasher = DownloadHasher()
+                hasher.update_from_file(destination_file, offset)
+                result = {'bytes_ready': offset, 'bytes_total': offset, 'speed_rate': 0, 'elapsed': 0}
+                result.update(hasher.digests())
+                yield result
+                return
+            response = requests.get(url, stream=True)
+
+        if offset > 0 and response.status_code == 206:
+            logger.debug('Resume download from %s bytes: %s', offset, destination_file)
+            mode = 'ab'
+        else:
+            offset = 0
+            mode = 'wb'
+
+        hasher = DownloadHasher()
+        if offset > 0:
+            hasher.update_from_file(destination_file, offset)
+
+        total_size = offset + int(response.headers.get('content-length', 0))
+
+        if save_manifest:
+            write_manifest(destination_file, {
+                'url': url,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'bytes_total': total_size
+            })
+
+        yield {'bytes_ready': offset, 'bytes_total': total_size, 'speed_rate': 0, 'elapsed': 0}
 
         if stop_event.is_set():
             return
 
-        progress_bar = tqdm(total=total_size, unit='iB', unit_scale=True, desc=description)
+        progress_bar = tqdm(total=total_size, initial=offset, unit='iB', unit_scale=True, desc=description)
+        format_dict = progress_bar.format_dict
 
-        with open(destination_file, 'wb') as file:
+        with open(destination_file, mode) as file:
 
             if stop_event.is_set():
                 progress_bar.close()
                 return
 
-            for data in response.iter_content(1024):
+            for data in response.iter_content(_CHUNK_SIZE):
 
                 if stop_event.is_set():
                     progress_bar.close()
                     return
 
                 file.write(data)
+                hasher.update(data)
                 progress_bar.update(len(data))
                 format_dict = progress_bar.format_dict
 
@@ -62,10 +207,131 @@ class HttpDownloader(Downloader):
                     'speed_rate': format_dict['rate'],
                     'elapsed': format_dict['elapsed']
                 }
-        yield {
+        result = {
             'bytes_ready': format_dict['n'],
             'bytes_total': format_dict['n'],
             'speed_rate': format_dict['rate'],
             'elapsed': format_dict['elapsed']
         }
+        result.update(hasher.digests())
+        yield result
         progress_bar.close()
+
+    def _download_segmented(self, url: str, destination_file: str, description: str, stop_event: threading.Event,
+                            manifest: dict, connections: int, save_manifest=False):
+        total_size = manifest['bytes_total']
+        segments = manifest['segments']
+        bytes_done = sum(segment[2] for segment in segments)
+
+        yield {'bytes_ready': bytes_done, 'bytes_total': total_size, 'speed_rate': 0, 'elapsed': 0}
+
+        abort_event = threading.Event()
+        progress_lock = threading.Lock()
+        errors = []
+
+        pending_segments = iter([segment for segment in segments if segment[0] + segment[2] <= segment[1]])
+
+        def fetch_range(session, segment):
+            start, end, done = segment
+            headers = {'Range': f'bytes={start + done}-{end}'}
+            with session.get(url, headers=headers, stream=True) as response:
+                if response.status_code != 206:
+                    raise Exception(f'Range request failed with status code {response.status_code}')
+
+                with open(destination_file, 'r+b') as segment_file:
+                    segment_file.seek(start + done)
+                    for data in response.iter_content(_CHUNK_SIZE):
+                        if stop_event.is_set() or abort_event.is_set():
+                            return
+                        segment_file.write(data)
+                        # Hasher reads the file up to the counted bytes, so they must not stay in the write buffer.
+                        segment_file.flush()
+                        with progress_lock:
+                            segment[2] += len(data)
+
+                    if segment_file.tell() != end + 1:
+                        raise Exception(f'Segment {start}-{end} is incomplete')
+
+        def fetch_segments():
+            try:
+                with requests.Session() as session:
+                    while not stop_event.is_set() and not abort_event.is_set():
+                        with progress_lock:
+                            segment = next(pending_segments, None)
+                        if segment is None:
+                            return
+                        fetch_range(session, segment)
+            except Exception as e:
+                errors.append(e)
+                abort_event.set()
+
+        def write_progress_manifest():
+            if not save_manifest:
+                return
+            with progress_lock:
+                snapshot = dict(manifest)
+                snapshot['segments'] = [list(segment) for segment in segments]
+            write_manifest(destination_file, snapshot)
+
+        write_progress_manifest()
+
+        workers = []
+        for _ in range(connections):
+            worker = threading.Thread(target=fetch_segments, daemon=True)
+            workers.append(worker)
+            worker.start()
+
+        # Segments are written out of order, so the hasher follows the contiguous downloaded prefix and reads it
+        # back while it is still in the page cache. Only segments that were in progress when the prefix reached them
+        # are left for the last pass.
+        hasher = DownloadHasher()
+
+        progress_bar = tqdm(total=total_size, initial=bytes_done, unit='iB', unit_scale=True, desc=description)
+        reported = bytes_done
+        last_manifest_save = time.time()
+        try:
+            while any(worker.is_alive() for worker in workers):
+                time.sleep(_PROGRESS_INTERVAL)
+
+                if stop_event.is_set():
+                    return
+
+                with progress_lock:
+                    bytes_ready = sum(segment[2] for segment in segments)
+                    contiguous_bytes = _contiguous_bytes(segments)
+                hasher.update_from_file(destination_file, contiguous_bytes)
+                progress_bar.update(bytes_ready - reported)
+                reported = bytes_ready
+                format_dict = progress_bar.format_dict
+
+                if time.time() - last_manifest_save > _MANIFEST_SAVE_INTERVAL:
+                    write_progress_manifest()
+                    last_manifest_save = time.time()
+
+                yield {
+                    'bytes_ready': format_dict['n'],
+                    'bytes_total': format_dict['total'],
+                    'speed_rate': format_dict['rate'],
+                    'elapsed': format_dict['elapsed']
+                }
+        finally:
+            abort_event.set()
+            for worker in workers:
+                worker.join(_JOIN_TIMEOUT)
+            write_progress_manifest()
+            progress_bar.close()
+
+        if errors:
+            raise errors[0]
+
+        hasher.update_from_file(destination_file, total_size)
+
+        format_dict = progress_bar.format_dict
+        result = {
+            'bytes_ready': total_size,
+            'bytes_total': total_size,
+            'speed_rate': format_dict['rate'],
+            'elapsed': format_dict['elapsed']
+        }
+        result.update(hasher.digests())
+        yield result
@@ -0,0 +1,76 @@
+import json
+import os
+
+from scripts.mo.environment import logger
+
+PARTIAL_EXTENSION = '.part'
+_MANIFEST_EXTENSION = '.json'
+
+
+def get_partial_file_path(destination_file: str) -> str:
+    return destination_file + PARTIAL_EXTENSION
+
+
+def _get_manifest_path(partial_file: str) -> str:
+    return partial_file + _MANIFEST_EXTENSION
+
+
+def read_manifest(partial_file: str):
+    """
+    Reads sidecar manifest of partially downloaded file.
+    :param partial_file: path to partially downloaded file.
+    :return: manifest dictionary or None if partial file or manifest is missing or broken.
+    """
+    manifest_path = _get_manifest_path(partial_file)
+    if not os.path.isfile(partial_file) or not os.path.isfile(manifest_path):
+        return None
+    try:
+        with open(manifest_path) as file:
+            return json.load(file)
+    except Exception as ex:
+        logger.warning(f'Failed to read download manifest {manifest_path}: {ex}')
+        return None
+
+
+def write_manifest(partial_file: str, manifest: dict):
+    """
+    Writes sidecar manifest of partially downloaded file. Manifest is replaced atomically to survive crashes.
+    :param partial_file: path to partially downloaded file.
+    :param manifest: manifest dictionary with url, validators and progress.
+    :return: None
+    """
+    manifest_path = _get_manifest_path(partial_file)
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w') as file:
+        json.dump(manifest, file)
+    os.replace(tmp_path, manifest_path)
+
+
+def is_manifest_valid(manifest, url: str, etag=None, last_modified=None) -> bool:
+    """
+    Checks partial file could be resumed.
+    :param manifest: manifest dictionary.
+    :param url: url file is downloaded from.
+    :param etag: current ETag header value of remote file.
+    :param last_modified: current Last-Modified header value of remote file.
+    :return: True if manifest describes the same remote file.
+    """
+    if manifest is None or manifest.get('url') != url:
+        return False
+    if etag and manifest.get('etag') and etag != manifest['etag']:
+        return False
+    if last_modified and manifest.get('last_modified') and last_modified != manifest['last_modified']:
+        return False
+    return True
+
+
+def remove_manifest(partial_file: str):
+    manifest_path = _get_manifest_path(partial_file)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+
+def remove_partial_file(partial_file: str):
+    if os.path.exists(partial_file):
+        os.remove(partial_file)
+    remove_manifest(partial_file)
@@ -1,4 +1,3 @@
-import hashlib
 import logging
 import os.path
 from typing import Callable
@@ -15,6 +14,10 @@ LAYOUT_TABLE = 'Table'
 DEFAULT_CARD_WIDTH = 250
 DEFAULT_CARD_HEIGHT = 350
 
+DEFAULT_DOWNLOAD_CONCURRENCY = 3
+DEFAULT_DOWNLOAD_HOST_CONCURRENCY = 2
+DEFAULT_DOWNLOAD_SEGMENTS = 4
+
 _SETTINGS_FILE = 'settings.txt'
 
 
@@ -59,7 +62,11 @@ class Environment:
     storage_error: str
 
     storage_type: Callable[[], str]
+    firebase_mirror: Callable[[], bool]
     download_preview: Callable[[], bool]
+    download_concurrency: Callable[[], int]
+    download_host_concurrency: Callable[[], int]
+    download_segments: Callable[[], int]
     model_path: Callable[[], str]
     vae_path: Callable[[], str]
     lora_path: Callable[[], str]
@@ -121,14 +128,3 @@ class Environment:
 
 
 env = Environment()
-
-
-def calculate_md5(file_path):
-    with open(file_path, 'rb') as f:
-        md5 = hashlib.md5()
-        while True:
-            data = f.read(1024)
-            if not data:
-                break
-            md5.update(data)
-    return md5.hexdigest()
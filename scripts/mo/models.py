@@ -71,8 +71,12 @@ class Record:
         self.created_at = created_at
         self.groups = groups
         self.subdir = subdir
+        # File existence resolved for a batch of records, checked on demand when None.
+        self.downloaded = None
 
     def is_file_exists(self) -> bool:
+        if self.downloaded is not None:
+            return self.downloaded
         return bool(self.location) and os.path.isfile(self.location)
 
     def is_downloadable(self) -> bool:
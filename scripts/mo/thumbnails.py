@@ -0,0 +1,280 @@
+import hashlib
+import os
+import queue
+import tempfile
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+from PIL import Image
+
+from scripts.mo.data.file_watcher import FileWatcher, FILE_KIND_PREVIEW, EVENT_CREATED
+from scripts.mo.environment import env, logger
+from scripts.mo.utils import fit_card_image
+
+_THUMBNAIL_DIR = 'thumbnail_cache'
+_WEBP_QUALITY = 85
+# Cache size limit, least recently used thumbnails are removed down to the target size once it's exceeded.
+_CACHE_MAX_SIZE = 512 * 1024 * 1024
+_CACHE_TARGET_SIZE = 384 * 1024 * 1024
+# Cache size is checked after this many generated thumbnails.
+_CACHE_CHECK_INTERVAL = 200
+# Thumbnails modification time is updated on use not more often than this, in seconds.
+_CACHE_TOUCH_INTERVAL = 24 * 60 * 60
+# Temporary files older than this are left from interrupted generation.
+_TEMP_FILE_MAX_AGE = 60 * 60
+
+_WARMER_WORKERS = 2
+_WARMER_QUEUE_SIZE = 4096
+# Pause after every generated thumbnail, so warming doesn't compete with requests for CPU.
+_WARMER_DELAY = 0.05
+# Pause used while downloads are running, only the first worker is active then.
+_WARMER_BUSY_DELAY = 0.5
+
+_generation_locks = {}
+_generation_locks_lock = threading.Lock()
+
+_generated_count = 0
+_prune_lock = threading.Lock()
+
+
+def _get_thumbnail_dir() -> str:
+    return os.path.join(env.script_dir, _THUMBNAIL_DIR)
+
+
+def get_thumbnail_key(preview_path: str) -> Optional[str]:
+    """
+    Creates thumbnail cache key from preview path, modification time and size, and the card size. Key is changed
+    whenever preview file is replaced or card size setting is changed.
+    :param preview_path: preview image path.
+    :return: hex key string or None if preview file doesn't exist.
+    """
+    try:
+        stat_result = os.stat(preview_path)
+    except OSError:
+        return None
+    value = f'{os.path.abspath(preview_path)}|{stat_result.st_mtime_ns}|{stat_result.st_size}|' \
+            f'{env.card_width()}x{env.card_height()}'
+    return hashlib.sha1(value.encode('utf-8')).hexdigest()
+
+
+def _get_thumbnail_path(key: str) -> str:
+    return os.path.join(_get_thumbnail_dir(), key[:2], key + '.webp')
+
+
+def _get_generation_lock(key: str) -> threading.Lock:
+    with _generation_locks_lock:
+        lock = _generation_locks.get(key)
+        if lock is None:
+            lock = threading.Lock()
+            _generation_locks[key] = lock
+        return lock
+
+
+def _release_generation_lock(key: str):
+    with _generation_locks_lock:
+        _generation_locks.pop(key, None)
+
+
+def _generate_thumbnail(preview_path: str, thumbnail_path: str):
+    os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
+    with Image.open(preview_path) as image:
+        thumbnail = fit_card_image(image)
+
+    # Written to a temporary file first, so a request never reads half-written thumbnail.
+    fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(thumbnail_path))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            thumbnail.save(f, 'WEBP', quality=_WEBP_QUALITY)
+        os.replace(temp_path, thumbnail_path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _touch_thumbnail(thumbnail_path: str):
+    # Modification time tells which thumbnails were used recently, it's updated rarely to avoid writes on every request.
+    try:
+        if time.time() - os.path.getmtime(thumbnail_path) > _CACHE_TOUCH_INTERVAL:
+            os.utime(thumbnail_path)
+    except OSError:
+        pass
+
+
+def prune_thumbnail_cache():
+    """
+    Removes least recently used thumbnails when the cache is larger than the limit, and temporary files left from
+    interrupted generation. Thumbnails of replaced or removed previews are never requested again, so they are
+    removed this way too.
+    :return: None
+    """
+    thumbnail_dir = _get_thumbnail_dir()
+    if not os.path.isdir(thumbnail_dir):
+        return
+
+    with _prune_lock:
+        now = time.time()
+        thumbnails = []
+        total_size = 0
+        for root, _, files in os.walk(thumbnail_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat_result = os.stat(path)
+                    if name.endswith('.tmp'):
+                        if now - stat_result.st_mtime > _TEMP_FILE_MAX_AGE:
+                            os.remove(path)
+                        continue
+                except OSError:
+                    continue
+                thumbnails.append((stat_result.st_mtime, stat_result.st_size, path))
+                total_size += stat_result.st_size
+
+        if total_size <= _CACHE_MAX_SIZE:
+            return
+
+        removed = 0
+        thumbnails.sort()
+        for _, size, path in thumbnails:
+            if total_size <= _CACHE_TARGET_SIZE:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_size -= size
+            removed += 1
+        logger.info(f'Removed {removed} thumbnails from the cache, {total_size // (1024 * 1024)}MB left')
+
+
+def _on_thumbnail_generated():
+    global _generated_count
+    with _generation_locks_lock:
+        _generated_count += 1
+        is_check_needed = _generated_count % _CACHE_CHECK_INTERVAL == 0
+    if is_check_needed:
+        prune_thumbnail_cache()
+
+
+def get_thumbnail(preview_path: str, key: Optional[str] = None) -> Optional[Tuple[str, str]]:
+    """
+    Returns cached card size thumbnail of the preview image, thumbnail is generated if it isn't cached yet.
+    :param preview_path: preview image path.
+    :param key: thumbnail key if it's already calculated by caller.
+    :return: tuple of thumbnail path and key, or None if preview doesn't exist or can't be read.
+    """
+    if key is None:
+        key = get_thumbnail_key(preview_path)
+        if key is None:
+            return None
+
+    thumbnail_path = _get_thumbnail_path(key)
+    if os.path.isfile(thumbnail_path):
+        _touch_thumbnail(thumbnail_path)
+        return thumbnail_path, key
+
+    is_generated = False
+    lock = _get_generation_lock(key)
+    with lock:
+        try:
+            if not os.path.isfile(thumbnail_path):
+                _generate_thumbnail(preview_path, thumbnail_path)
+                is_generated = True
+        except Exception as ex:
+            logger.warning(f'Failed to create thumbnail for {preview_path}: {ex}')
+            return None
+        finally:
+            _release_generation_lock(key)
+
+    if is_generated:
+        _on_thumbnail_generated()
+    return thumbnail_path, key
+
+
+class ThumbnailWarmer:
+    """
+    Generates thumbnails in background for previews found by the FileWatcher or written by the DownloadManager, so
+    home screen requests find them cached. Queue is bounded, previews that don't fit are generated on request instead.
+    Cache size is checked on start, before previews are queued.
+    """
+    __instance = None
+    __lock = threading.Lock()
+
+    def __init__(self):
+        self._queue = queue.Queue(maxsize=_WARMER_QUEUE_SIZE)
+        self._queued = set()
+        self._queued_lock = threading.Lock()
+        self._threads = []
+        self._is_busy: Callable[[], bool] = lambda: False
+
+    @staticmethod
+    def instance():
+        if ThumbnailWarmer.__instance is None:
+            with ThumbnailWarmer.__lock:
+                if ThumbnailWarmer.__instance is None:
+                    ThumbnailWarmer.__instance = ThumbnailWarmer()
+        return ThumbnailWarmer.__instance
+
+    def start(self, is_busy: Callable[[], bool]):
+        """
+        Starts worker threads and subscribes to previews found by the FileWatcher. Previews that the watcher has
+        already found are queued too.
+        :param is_busy: returns True while warming should slow down, e.g. when downloads are running.
+        :return: None
+        """
+        with ThumbnailWarmer.__lock:
+            if self._threads:
+                return
+            self._is_busy = is_busy
+            for index in range(_WARMER_WORKERS):
+                thread = threading.Thread(target=self._run, args=(index,), name=f'mo-thumbnail-warmer-{index}',
+                                          daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        FileWatcher.instance().add_listener(self._on_files_changed)
+        threading.Thread(target=self._submit_known_previews, name='mo-thumbnail-warmer-init', daemon=True).start()
+
+    def submit(self, preview_path: str):
+        """
+        Queues thumbnail generation, does nothing if the preview is already queued or the queue is full.
+        :param preview_path: preview image path.
+        :return: None
+        """
+        with self._queued_lock:
+            if preview_path in self._queued:
+                return
+            try:
+                self._queue.put_nowait(preview_path)
+            except queue.Full:
+                logger.debug(f'Thumbnails queue is full, skipped {preview_path}')
+                return
+            self._queued.add(preview_path)
+
+    def _submit_known_previews(self):
+        try:
+            prune_thumbnail_cache()
+        except Exception as ex:
+            logger.exception(ex)
+        for preview_path in FileWatcher.instance().get_preview_files():
+            self.submit(preview_path)
+
+    def _on_files_changed(self, events: List):
+        for event in events:
+            if event['kind'] == FILE_KIND_PREVIEW and event['event'] == EVENT_CREATED:
+                self.submit(event['path'])
+
+    def _run(self, index: int):
+        while True:
+            preview_path = self._queue.get()
+            with self._queued_lock:
+                self._queued.discard(preview_path)
+
+            while index > 0 and self._is_busy():
+                time.sleep(_WARMER_BUSY_DELAY)
+
+            try:
+                get_thumbnail(preview_path)
+            except Exception as ex:
+                logger.exception(ex)
+            time.sleep(_WARMER_BUSY_DELAY if self._is_busy() else _WARMER_DELAY)
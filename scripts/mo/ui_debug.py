@@ -1,12 +1,16 @@
 import json
 import os
+import threading
 
 import gradio as gr
 
-from scripts.mo.environment import env
+from scripts.mo.data.bulk_hasher import BulkHasher
+from scripts.mo.data.file_watcher import FileWatcher
+from scripts.mo.data.hash_index import HashIndex
 from scripts.mo.models import ModelType
-from scripts.mo.utils import get_model_files_in_dir, find_preview_file, link_preview, read_hash_cache, \
-    calculate_file_temp_hash, write_hash_cache, calculate_sha256
+from scripts.mo.utils import link_preview
+
+_hash_stop_event = threading.Event()
 
 
 def _ui_state_report():
@@ -17,12 +21,13 @@ def _ui_state_report():
 def _on_local_files_scan_click():
     result = []
 
+    watcher = FileWatcher.instance()
+
     def search_in_dir(model_type) -> list:
-        dir_path = env.get_model_path(model_type)
         local = []
-        files = get_model_files_in_dir(dir_path)
+        files = watcher.get_model_files(model_type)
         for file in files:
-            preview_file = find_preview_file(file)
+            preview_file = watcher.find_preview_file(file)
             rec = {
                 'filename': os.path.basename(file),
                 'model_type': model_type.value,
@@ -61,64 +66,52 @@ def _ui_local_files():
 
 
 def _on_read_hash_click():
-    cache = read_hash_cache()
-    return [
-        gr.JSON.update(value=json.dumps(cache)),
-        gr.Button.update(visible=False)
-    ]
+    entries = HashIndex.instance().get_all_entries()
+    return gr.JSON.update(value=json.dumps(entries))
 
 
 def _on_calculate_hash_click():
-    result = []
-
-    def calc_in_dir(model_type) -> list:
-        dir_path = env.get_model_path(model_type)
-        local = []
-        files = get_model_files_in_dir(dir_path)
-        for file in files:
-            rec = {
-                'path': file,
-                'temp_hash': calculate_file_temp_hash(file),
-                'sha256': calculate_sha256(file)
-            }
-            local.append(rec)
-        return local
-
-    result.extend(calc_in_dir(ModelType.CHECKPOINT))
-    result.extend(calc_in_dir(ModelType.VAE))
-    result.extend(calc_in_dir(ModelType.LORA))
-    result.extend(calc_in_dir(ModelType.HYPER_NETWORK))
-    result.extend(calc_in_dir(ModelType.EMBEDDING))
-    result.extend(calc_in_dir(ModelType.LYCORIS))
+    _hash_stop_event.clear()
 
-    return [
-        gr.JSON.update(value=json.dumps(result)),
+    yield [
+        gr.JSON.update(),
+        gr.Button.update(visible=False),
         gr.Button.update(visible=True)
     ]
 
+    progress = {}
+    for progress in BulkHasher().hash_files(FileWatcher.instance().get_all_model_files(),
+                                            _hash_stop_event):
+        if progress.get('results') is None:
+            yield [
+                gr.JSON.update(value=json.dumps(progress)),
+                gr.Button.update(),
+                gr.Button.update()
+            ]
+
+    yield [
+        gr.JSON.update(value=json.dumps(progress)),
+        gr.Button.update(visible=True),
+        gr.Button.update(visible=False)
+    ]
 
-def _on_compare_hash_click():
-    result = []
 
-    cache = read_hash_cache()
+def _on_cancel_hash_click():
+    _hash_stop_event.set()
 
-    def find_in_cache(file_path, temp_hash):
-        for entry in cache:
-            if entry.get('path') == file_path and entry.get('temp_hash') == temp_hash and \
-                    entry.get('sha256') is not None:
-                return entry['sha256']
+
+def _on_compare_hash_click():
+    result = []
 
     def search_in_dir(model_type) -> list:
-        dir_path = env.get_model_path(model_type)
         local = []
-        files = get_model_files_in_dir(dir_path)
+        files = FileWatcher.instance().get_model_files(model_type)
+        cached = HashIndex.instance().lookup_many(files)
         for file in files:
-            temp_hash = calculate_file_temp_hash(file)
-
+            entry = cached.get(file)
             rec = {
                 'path': file,
-                'temp_hash': temp_hash,
-                'sha256': find_in_cache(file, temp_hash)
+                'sha256': None if entry is None else entry['sha256']
             }
 
             local.append(rec)
@@ -131,14 +124,7 @@ def _on_compare_hash_click():
     result.extend(search_in_dir(ModelType.EMBEDDING))
     result.extend(search_in_dir(ModelType.LYCORIS))
 
-    return [
-        gr.JSON.update(value=json.dumps(result)),
-        gr.Button.update(visible=False)
-    ]
-
-
-def _on_hash_cache_save_click(json_data):
-    write_hash_cache(json_data)
+    return gr.JSON.update(value=json.dumps(result))
 
 
 def _ui_hash_cache():
@@ -146,15 +132,15 @@ def _ui_hash_cache():
         read_button = gr.Button('Read hash cache')
         compare_hash_button = gr.Button('Compare hash with cache')
         calculate_button = gr.Button('Calculate hashes')
-        save_hash_button = gr.Button('Save hash', visible=False)
+        cancel_calculate_button = gr.Button('Cancel hashes calculation', visible=False)
 
         hash_cache_json = gr.JSON(label='Local files')
 
-    read_button.click(fn=_on_read_hash_click, outputs=[hash_cache_json, save_hash_button])
-    calculate_button.click(fn=_on_calculate_hash_click, outputs=[hash_cache_json, save_hash_button])
-    compare_hash_button.click(fn=_on_compare_hash_click, outputs=[hash_cache_json, save_hash_button])
-
-    save_hash_button.click(fn=_on_hash_cache_save_click, inputs=hash_cache_json)
+    read_button.click(fn=_on_read_hash_click, outputs=hash_cache_json)
+    calculate_button.click(fn=_on_calculate_hash_click,
+                           outputs=[hash_cache_json, calculate_button, cancel_calculate_button])
+    cancel_calculate_button.click(fn=_on_cancel_hash_click, queue=False)
+    compare_hash_button.click(fn=_on_compare_hash_click, outputs=hash_cache_json)
 
 
 def debug_ui_block():
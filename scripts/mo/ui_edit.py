@@ -6,12 +6,14 @@ import time
 import gradio as gr
 
 import scripts.mo.ui_styled_html as styled
+from scripts.mo.data.file_watcher import FileWatcher
 from scripts.mo.data.storage import map_dict_to_record
-from scripts.mo.dl.download_manager import DownloadManager, calculate_sha256
+from scripts.mo.data.hash_index import HashIndex
+from scripts.mo.dl.download_manager import DownloadManager
 from scripts.mo.environment import env, logger
 from scripts.mo.models import Record, ModelType
 from scripts.mo.ui_navigation import generate_ui_token
-from scripts.mo.utils import is_blank, is_valid_filename, is_valid_url, get_model_files_in_dir
+from scripts.mo.utils import is_blank, is_valid_filename, is_valid_url
 
 
 def is_directory_path_valid(path):
@@ -99,11 +101,11 @@ def _on_description_output_changed(record_data, name: str, model_type_value: str
             if old_record.location == location:
                 sha256_hash = old_record.sha256_hash
             elif os.path.isfile(location):
-                sha256_hash = calculate_sha256(location)
+                sha256_hash = HashIndex.instance().get_sha256(location)
         elif sha256_state is not None:
             sha256_hash = sha256_state
         elif os.path.isfile(location):
-            sha256_hash = calculate_sha256(location)
+            sha256_hash = HashIndex.instance().get_sha256(location)
 
         record = Record(
             id_=record_id,
@@ -215,7 +217,7 @@ def _get_bind_location_dropdown_update(model_type_value, current_location: str):
 
     lookup_dir = os.path.join(env.get_model_path(model_type), '')
 
-    files_found = get_model_files_in_dir(lookup_dir)
+    files_found = FileWatcher.instance().get_model_files(model_type)
     # files_exclude = env.storage.get_all_records_locations()
     # files_unbounded = [x for x in files_found if x not in files_exclude]
 
@@ -1,4 +1,6 @@
 import json
+import threading
+import time
 
 import gradio as gr
 
@@ -7,17 +9,80 @@ from scripts.mo.data.record_utils import load_records_and_filter
 from scripts.mo.environment import env, LAYOUT_CARDS
 from scripts.mo.models import ModelType, ModelSort
 
+# Number of records rendered with the home screen, next pages are loaded by main.js while scrolling.
+HOME_PAGE_SIZE = 50
 
-def _prepare_data(state_json: str):
+# Delay before search query is applied, query is dropped if another one comes during the delay.
+_SEARCH_DEBOUNCE = 0.4
+
+
+class _RequestVersions:
+    """
+    Counts requests of a single UI session, so superseded requests can be dropped. Instance is kept in gr.State, which
+    copies it for every session.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._search = 0
+        self._render = 0
+
+    def __deepcopy__(self, memo):
+        return _RequestVersions()
+
+    def next_search(self) -> int:
+        with self._lock:
+            self._search += 1
+            return self._search
+
+    def is_latest_search(self, version: int) -> bool:
+        with self._lock:
+            return self._search == version
+
+    def next_render(self) -> int:
+        with self._lock:
+            self._render += 1
+            return self._render
+
+    def is_latest_render(self, version: int) -> bool:
+        with self._lock:
+            return self._render == version
+
+
+def _skip_render_updates():
+    return [
+        gr.HTML.update(),
+        gr.Button.update(),
+        gr.Dropdown.update()
+    ]
+
+
+def _prepare_data(state_json: str, versions: _RequestVersions):
+    version = versions.next_render()
     state = json.loads(state_json)
 
-    records = load_records_and_filter(state, True)
+    # Requests are not queued, so a newer one could already be started when this one gets here.
+    if not versions.is_latest_render(version):
+        return _skip_render_updates()
+
+    records = load_records_and_filter(state, True, HOME_PAGE_SIZE + 1, 0)
+    if not versions.is_latest_render(version):
+        return _skip_render_updates()
+
+    has_more = len(records) > HOME_PAGE_SIZE
+    records = records[:HOME_PAGE_SIZE]
 
     if env.layout() == LAYOUT_CARDS:
         html = styled.records_cards(records)
     else:
         html = styled.records_table(records)
 
+    if has_more:
+        html += styled.load_more_sentinel(state_json, len(records), HOME_PAGE_SIZE)
+
+    if not versions.is_latest_render(version):
+        return _skip_render_updates()
+
     return [
         html,
         gr.Button.update(visible=len(records) > 0),
@@ -25,6 +90,11 @@ def _prepare_data(state_json: str):
     ]
 
 
+def _on_reload_clicked(state_json: str, versions: _RequestVersions):
+    env.storage.invalidate()
+    return _prepare_data(state_json, versions)
+
+
 def _get_available_groups():
     return env.storage.get_available_groups()
 
@@ -47,12 +117,28 @@ def _on_downloaded_first_changed(sort_downloaded_first, state_json):
     return json.dumps(state)
 
 
-def _on_search_query_changed(query, state_json):
+def _on_search_query_changed(versions: _RequestVersions):
+    # State isn't changed here, filters changed during the delay would be reverted by the state taken before it. The
+    # query is applied by the search_trigger_box change event, which gets the current state instead.
+    version = versions.next_search()
+    time.sleep(_SEARCH_DEBOUNCE)
+    if not versions.is_latest_search(version):
+        return gr.Textbox.update()
+    return str(version)
+
+
+def _on_search_query_applied(query, state_json):
     state = json.loads(state_json)
     state['query'] = query
     return json.dumps(state)
 
 
+def _on_full_text_changed(full_text, state_json):
+    state = json.loads(state_json)
+    state['full_text'] = full_text
+    return json.dumps(state)
+
+
 def _on_model_type_box_changed(selected, state_json):
     state = json.loads(state_json)
     state['model_types'] = selected
@@ -98,6 +184,7 @@ def home_ui_block():
 
     initial_state = {
         'query': '',
+        'full_text': False,
         'model_types': [],
         'groups': [],
         'show_downloaded': True,
@@ -109,11 +196,18 @@ def home_ui_block():
     initial_state_json = json.dumps(initial_state)
 
     with gr.Blocks():
+        versions = gr.State(_RequestVersions())
+
         refresh_box = gr.Textbox(label='refresh_box',
                                  elem_classes='mo-alert-warning',
                                  visible=False,
                                  interactive=False)
 
+        search_trigger_box = gr.Textbox(label='search_trigger_box',
+                                        elem_classes='mo-alert-warning',
+                                        visible=False,
+                                        interactive=False)
+
         state_box = gr.Textbox(value='',
                                label='state_box',
                                elem_classes='mo-alert-warning',
@@ -151,6 +245,8 @@ def home_ui_block():
             with gr.Group():
                 search_box = gr.Textbox(label='Search by name',
                                         value=initial_state['query'])
+                full_text_checkbox = gr.Checkbox(label='Search in description, prompts and groups',
+                                                 value=initial_state['full_text'])
                 model_types_dropdown = gr.Dropdown([model_type.value for model_type in ModelType],
                                                    value=initial_state['model_types'],
                                                    label='Model types',
@@ -166,14 +262,15 @@ def home_ui_block():
                 show_local_files_checkbox = gr.Checkbox(label='Show local files',
                                                         value=initial_state['show_local_files'])
 
-        html_content_widget = gr.HTML()
+        html_content_widget = gr.HTML(elem_id='mo-home-content')
 
-        reload_button.click(_prepare_data, inputs=state_box,
-                            outputs=[html_content_widget, download_all_button, groups_dropdown])
-        refresh_box.change(_prepare_data, inputs=state_box,
-                           outputs=[html_content_widget, download_all_button, groups_dropdown])
-        state_box.change(_prepare_data, inputs=state_box,
-                         outputs=[html_content_widget, download_all_button, groups_dropdown])
+        # Not queued, so a newer request doesn't wait for the superseded ones and they can be dropped.
+        reload_button.click(_on_reload_clicked, inputs=[state_box, versions],
+                            outputs=[html_content_widget, download_all_button, groups_dropdown], queue=False)
+        refresh_box.change(_prepare_data, inputs=[state_box, versions],
+                           outputs=[html_content_widget, download_all_button, groups_dropdown], queue=False)
+        state_box.change(_prepare_data, inputs=[state_box, versions],
+                         outputs=[html_content_widget, download_all_button, groups_dropdown], queue=False)
 
         debug_button.click(fn=None, _js='navigateDebug')
         download_all_button.click(fn=None, inputs=state_box, _js='navigateDownloadRecordList')
@@ -188,7 +285,9 @@ def home_ui_block():
                                          inputs=[downloaded_first_checkbox, state_box],
                                          outputs=state_box)
 
-        search_box.change(_on_search_query_changed, inputs=[search_box, state_box], outputs=state_box)
+        search_box.change(_on_search_query_changed, inputs=versions, outputs=search_trigger_box, queue=False)
+        search_trigger_box.change(_on_search_query_applied, inputs=[search_box, state_box], outputs=state_box)
+        full_text_checkbox.change(_on_full_text_changed, inputs=[full_text_checkbox, state_box], outputs=state_box)
         model_types_dropdown.change(_on_model_type_box_changed, inputs=[model_types_dropdown, state_box],
                                     outputs=state_box)
         groups_dropdown.change(_on_group_box_changed, inputs=[groups_dropdown, state_box], outputs=state_box)
@@ -5,32 +5,46 @@ from datetime import datetime
 import gradio as gr
 
 from scripts.mo.data.record_utils import load_records_and_filter
+from scripts.mo.data.records_reader import read_records, NDJSON_EXTENSIONS
 from scripts.mo.data.storage import map_record_to_dict, map_dict_to_record
-from scripts.mo.environment import env
+from scripts.mo.environment import env, logger
 from scripts.mo.ui_civitai_import import civitai_import_ui_block
 
+_IMPORT_BATCH_SIZE = 500
+
 
 def _on_import_file_change(import_file):
     if import_file is None or not import_file or not os.path.exists(import_file.name):
-        return gr.HTML.update('')
-
-    with open(import_file.name, 'r') as f:
-        records_dict_list = json.load(f)
-
-    if len(records_dict_list) == 0:
-        return gr.HTML.update('Nothing to import')
+        yield gr.HTML.update('')
+        return
+
+    records_imported = []
+    batch = []
+    try:
+        for record_dict in read_records(import_file.name):
+            batch.append(map_dict_to_record('', record_dict))
+            if len(batch) == _IMPORT_BATCH_SIZE:
+                env.storage.add_records(batch)
+                records_imported.extend(record.name for record in batch)
+                batch = []
+                yield gr.HTML.update(value=f'<b>Importing... ({len(records_imported)})</b>')
+
+        if batch:
+            env.storage.add_records(batch)
+            records_imported.extend(record.name for record in batch)
+    except Exception as ex:
+        logger.exception(ex)
+        yield gr.HTML.update(value=f'<b>Import failed after {len(records_imported)} records: {ex}</b>')
+        return
+
+    if len(records_imported) == 0:
+        yield gr.HTML.update('Nothing to import')
     else:
-        records_imported = []
-        for record_dict in records_dict_list:
-            record = map_dict_to_record('', record_dict)
-            env.storage.add_record(record)
-            records_imported.append(record.name)
-
         output = f'<b>Imported records: ({len(records_imported)})</b>'
         for name in records_imported:
             output += '<br>'
             output += name
-        return gr.HTML.update(value=output)
+        yield gr.HTML.update(value=output)
 
 
 def _on_export_click(filter_state_json, export_option):
@@ -67,7 +81,7 @@ def import_export_ui_block():
             gr.Markdown('')
             back_button = gr.Button('Back')
         with gr.Tab("Import JSON"):
-            import_file_widget = gr.File(label='Import .json file', file_types=['.json'])
+            import_file_widget = gr.File(label='Import .json or .jsonl file', file_types=['.json', *NDJSON_EXTENSIONS])
             import_result_widget = gr.HTML()
         with gr.Tab("Export JSON"):
             filter_state_box = gr.Textbox(value='',
@@ -3,6 +3,8 @@ import os
 import gradio as gr
 
 import scripts.mo.ui_styled_html as styled
+from scripts.mo.data.file_watcher import FileWatcher
+from scripts.mo.data.hash_index import HashIndex
 from scripts.mo.environment import env, logger
 from scripts.mo.ui_navigation import generate_ui_token
 from scripts.mo.utils import find_preview_file, find_info_file
@@ -49,6 +51,13 @@ def _on_id_change(record_id):
         ]
 
 
+def _refresh_removed_files(*paths):
+    watcher = FileWatcher.instance()
+    for path in paths:
+        if path:
+            watcher.refresh_path(path)
+
+
 def _on_remove_click(record_id, remove_record, remove_files):
     logger.info(f'_on_remove_click record_id: {record_id} remove_record: {remove_record} remove_files: {remove_files}')
     if os.path.isfile(record_id):
@@ -62,6 +71,8 @@ def _on_remove_click(record_id, remove_record, remove_files):
             os.remove(info_file)
 
         os.remove(record_id)
+        HashIndex.instance().remove(record_id)
+        _refresh_removed_files(record_id, preview_file, info_file)
     else:
         record = env.storage.get_record_by_id(record_id)
 
@@ -71,6 +82,7 @@ def _on_remove_click(record_id, remove_record, remove_files):
         if record.location and remove_files:
             if record.location and os.path.exists(record.location):
                 os.remove(record.location)
+                HashIndex.instance().remove(record.location)
 
             preview_path = find_preview_file(record.location)
             if preview_path and os.path.exists(preview_path):
@@ -80,6 +92,8 @@ def _on_remove_click(record_id, remove_record, remove_files):
             if info_file is not None and os.path.isfile(info_file):
                 os.remove(info_file)
 
+            _refresh_removed_files(record.location, preview_path, info_file)
+
     return generate_ui_token()
 
 
@@ -4,10 +4,10 @@ import os
 from typing import List
 
 import scripts.mo.ui_format as ui_format
+from scripts.mo.data.preview_resolver import get_best_preview_url
 from scripts.mo.data.storage import map_record_to_dict
 from scripts.mo.environment import env
 from scripts.mo.models import Record, ModelType
-from scripts.mo.utils import get_best_preview_url
 
 _NO_PREVIEW_DARK = 'file=extensions/sd-model-organizer/pic/no-preview-dark-blue.png'
 _NO_PREVIEW_LIGHT = 'file=extensions/sd-model-organizer/pic/no-preview-light.png'
@@ -79,7 +79,7 @@ def _model_type_css_class(model_type: ModelType) -> str:
     return css_class
 
 
-def _no_preview_image_url() -> str:
+def no_preview_image_url() -> str:
     if env.theme() == 'dark':
         return _NO_PREVIEW_DARK
     else:
@@ -108,7 +108,7 @@ def records_table(records: List) -> str:
         table_html += '<div class="mo-col mo-col-preview">'
         table_html += f'<img class="mo-preview-image" src="{preview_url}" ' \
                       f'alt="Preview image"' \
-                      f' onerror="this.onerror=null; this.src=\'{_no_preview_image_url()}\';"/>'
+                      f' onerror="this.onerror=null; this.src=\'{no_preview_image_url()}\';"/>'
         table_html += '</div>'
 
         # Add type column
@@ -235,14 +235,14 @@ def _details_field_row(title: str, field: str, is_even: bool) -> str:
 
 
 def _details_top(record: Record) -> str:
-    preview_url = get_best_preview_url(record)
+    preview_url = get_best_preview_url(record, original=True)
 
     content = '<div class="mo-details-row">'
 
     # Preview image
     content += '<div class="mo-details-col mo-details-col-preview">'
     content += f'<img class="mo-details-image" src="{preview_url}" alt="Preview Image" ' \
-               f'onerror="this.onerror=null; this.src=\'{_no_preview_image_url()}\';"/>'
+               f'onerror="this.onerror=null; this.src=\'{no_preview_image_url()}\';"/>'
     content += '</div>'
 
     # Details column
@@ -318,7 +318,7 @@ def records_cards(records: List) -> str:
 
         preview_url = get_best_preview_url(record)
         content += f'<img src="{preview_url}" alt="Preview Image" ' \
-                   f'onerror="this.onerror=null; this.src=\'{_no_preview_image_url()}\';"/>'
+                   f'onerror="this.onerror=null; this.src=\'{no_preview_image_url()}\';"/>'
 
         content += f'<div class="mo-card-blur-overlay-bottom">{html.escape(_limit_card_name(record.name))}</div>'
 
@@ -361,6 +361,43 @@ def records_cards(records: List) -> str:
     return content
 
 
+def load_more_sentinel(state_json: str, offset: int, limit: int) -> str:
+    """
+    Creates marker element placed after the records list, next pages are loaded by main.js when it gets visible.
+    :param state_json: filter state the list was loaded for.
+    :param offset: offset of the next page.
+    :param limit: page size.
+    :return: html string.
+    """
+    return f'<div class="mo-load-more" data-state="{html.escape(state_json)}" data-offset="{offset}" ' \
+           f'data-limit="{limit}" data-layout="{html.escape(env.layout())}" ' \
+           f'data-no-preview="{no_preview_image_url()}"></div>'
+
+
+def record_view_dict(record: Record) -> dict:
+    """
+    Creates compact record representation used by main.js to render cards and table rows of next pages.
+    :param record: record to display.
+    :return: dictionary with display fields.
+    """
+    result = {
+        'id': record.id_,
+        'name': _limit_card_name(record.name),
+        'model_type': record.model_type.value,
+        'model_type_class': _model_type_css_class(record.model_type),
+        'description': _limit_description(record.description),
+        'preview_url': get_best_preview_url(record),
+        'is_local': record.is_local_file_record()
+    }
+
+    if result['is_local']:
+        result['location'] = record.location
+        result['prefilled_json'] = json.dumps(map_record_to_dict(record))
+    else:
+        result['is_download_possible'] = record.is_download_possible()
+    return result
+
+
 def _downloads_header(record_id, title) -> str:
     content = '<div class="mo-downloads-header">'
     content += f'<h2 style="margin: 0;" id="title-{record_id}">{html.escape(title)}</h2>'
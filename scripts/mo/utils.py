@@ -1,17 +1,11 @@
-import datetime
-import hashlib
-import json
 import os
 import re
 import urllib.parse
-from typing import List
+from typing import Optional
 
 from PIL import Image
 
 from scripts.mo.environment import env
-from scripts.mo.models import Record
-
-_HASH_CACHE_FILENAME = 'hash_cache.json'
 
 MODEL_EXTENSIONS = ['.bin', '.ckpt', '.safetensors', '.pt']
 PREVIEW_EXTENSIONS = [".png", ".jpg", ".webp"]
@@ -47,26 +41,6 @@ def is_valid_filename(filename: str) -> bool:
     return bool(pattern.match(filename))
 
 
-def get_model_files_in_dir(lookup_dir: str) -> List:
-    """
-    Scans for model files in the lookup_dir, and it's child directories.
-    :param lookup_dir: directory path to scan.
-    :return: List of models in the directory and subdirectories.
-    """
-    root_dir = os.path.join(lookup_dir, '')
-    extensions = ('.bin', '.ckpt', '.safetensors', '.pt')
-    result = []
-
-    if os.path.isdir(root_dir):
-        for subdir, dirs, files in os.walk(root_dir):
-            for file in files:
-                ext = os.path.splitext(file)[-1].lower()
-                if ext in extensions:
-                    filepath = os.path.join(subdir, file)
-                    result.append(filepath)
-    return result
-
-
 def get_model_filename_without_extension(model_file):
     """
     Extracts filename without extension for models.
@@ -118,25 +92,29 @@ def find_info_file(model_file_path):
     return None
 
 
-def link_preview(preview_path):
+def link_preview(preview_path, mtime: Optional[float] = None, original: bool = False):
     """
     Creates link for model image preview file. File should be in one of the model supported directories.
     :param preview_path: path to model preview.
+    :param mtime: preview modification time, file is checked if None.
+    :param original: link to the full size image instead of the card size thumbnail.
     :return: link to model preview image.
     """
-    return "./mo/thumbnail?filename=" + urllib.parse.quote(preview_path.replace('\\', '/')) + "&mtime=" + \
-        str(os.path.getmtime(preview_path))
+    if mtime is None:
+        mtime = os.path.getmtime(preview_path)
+    link = "?filename=" + urllib.parse.quote(preview_path.replace('\\', '/')) + "&mtime=" + str(mtime)
+    if original:
+        return "./mo/preview" + link
+    # Thumbnails are cached by browsers as immutable, so the link is changed with the card size too.
+    return "./mo/thumbnail" + link + f"&size={env.card_width()}x{env.card_height()}"
 
 
-def resize_preview_image(input_file, output_file):
+def fit_card_image(image: Image.Image) -> Image.Image:
     """
-    Resizes input image to fit model card size.
-    :param input_file: input image file path.
-    :param output_file: output image file path.
-    :return: None
+    Scales and crops image to fill model card.
+    :param image: source image.
+    :return: new RGB image of card size.
     """
-    image = Image.open(input_file)
-
     desired_width = int(env.card_width() * 1.5)
     desired_height = int(env.card_height() * 1.5)
 
@@ -159,85 +137,15 @@ def resize_preview_image(input_file, output_file):
     y_position = (desired_height - new_height) // 2
 
     canvas.paste(resized_image, (x_position, y_position))
-
-    canvas.save(output_file, "JPEG")
-
-
-def calculate_file_temp_hash(file_path):
-    """
-    Calculates file "temp" hash. This has is based on file creation and modification timestamps and file size.
-    This is using to determinate file was changed or not.
-    :param file_path: path to target file.
-    :return: md5 hex digest string.
-    """
-    creation_timestamp = os.path.getctime(file_path)
-    creation_datetime = datetime.datetime.fromtimestamp(creation_timestamp)
-
-    modification_timestamp = os.path.getmtime(file_path)
-    modification_datetime = datetime.datetime.fromtimestamp(modification_timestamp)
-
-    size = os.path.getsize(file_path)
-
-    input_string = f'{creation_datetime} {modification_datetime} {size}'
-
-    md5_hash = hashlib.md5()
-    md5_hash.update(input_string.encode('utf-8'))
-    return md5_hash.hexdigest()
+    return canvas
 
 
-def calculate_sha256(file_path):
-    """
-    Calculates SHA256 file hash.
-    :param file_path: target file path.
-    :return: SHA256 hex digest string.
-    """
-    with open(file_path, 'rb') as file:
-        sha256_hash = hashlib.sha256()
-        while chunk := file.read(4096):
-            sha256_hash.update(chunk)
-    return sha256_hash.hexdigest()
-
-
-def get_hash_cache_file():
-    """
-    Returns hash cache file path.
-    :return: string file path.
-    """
-    return os.path.join(env.script_dir, _HASH_CACHE_FILENAME)
-
-
-def read_hash_cache() -> List:
-    """
-    Reads hash cache file data.
-    :return: hash cache data as a list of dictionaries.
-    """
-    file_path = get_hash_cache_file()
-    if os.path.isfile(file_path):
-        with open(file_path) as file:
-            return json.load(file)
-    return []
-
-
-def write_hash_cache(hash_cache: List):
-    """
-    Writes hash cache data to file.
-    :param hash_cache: list of dictionaries to save.
-    :return: None.
-    """
-    with open(get_hash_cache_file(), 'w') as file:
-        json.dump(hash_cache, file, indent=4)
-
-
-def get_best_preview_url(record: Record) -> str:
+def resize_preview_image(input_file, output_file):
     """
-    Returns url to local preview file if it available otherwise returns record.preview_url
-    :param record: record to get preview.
-    :return: url to image preview.
+    Resizes input image to fit model card size.
+    :param input_file: input image file path.
+    :param output_file: output image file path.
+    :return: None
     """
-    if record.location:
-        preview_path = find_preview_file(record.location)
-        if preview_path is None:
-            return record.preview_url
-        else:
-            return link_preview(preview_path)
-    return record.preview_url
+    with Image.open(input_file) as image:
+        fit_card_image(image).save(output_file, "JPEG")
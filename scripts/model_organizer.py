@@ -10,7 +10,10 @@ from modules.shared import OptionInfo
 
 from scripts.mo.api import init_extension_api
 from scripts.mo.data.init_storage import initialize_storage
+from scripts.mo.data.record_utils import start_files_state_tracking
+from scripts.mo.dl.download_manager import DownloadManager
 from scripts.mo.environment import *
+from scripts.mo.thumbnails import ThumbnailWarmer
 from scripts.mo.ui_main import main_ui_block
 
 
@@ -77,9 +80,23 @@ env.card_height = lambda: shared.opts.mo_card_height if hasattr(shared.opts, 'mo
 
 env.storage_type = lambda: shared.opts.mo_storage_type if hasattr(shared.opts, 'mo_storage_type') else STORAGE_SQLITE
 
+env.firebase_mirror = lambda: shared.opts.mo_firebase_mirror if hasattr(shared.opts, 'mo_firebase_mirror') else False
+
 env.download_preview = lambda: shared.opts.mo_download_preview if hasattr(shared.opts,
                                                                           'mo_download_preview') else True
 
+env.download_concurrency = lambda: shared.opts.mo_download_concurrency if \
+    hasattr(shared.opts, 'mo_download_concurrency') and shared.opts.mo_download_concurrency \
+    else DEFAULT_DOWNLOAD_CONCURRENCY
+
+env.download_host_concurrency = lambda: shared.opts.mo_download_host_concurrency if \
+    hasattr(shared.opts, 'mo_download_host_concurrency') and shared.opts.mo_download_host_concurrency \
+    else DEFAULT_DOWNLOAD_HOST_CONCURRENCY
+
+env.download_segments = lambda: shared.opts.mo_download_segments if \
+    hasattr(shared.opts, 'mo_download_segments') and shared.opts.mo_download_segments \
+    else DEFAULT_DOWNLOAD_SEGMENTS
+
 env.model_path = lambda: shared.opts.mo_model_path if hasattr(shared.opts, 'mo_model_path') and \
                                                       shared.opts.mo_model_path else _default_model_path()
 
@@ -112,7 +129,16 @@ def on_ui_settings():
         'mo_card_height': OptionInfo(350, 'Card height (350 default value):'),
         'mo_storage_type': OptionInfo(STORAGE_SQLITE, "Storage Type:", gr.Radio,
                                       {"choices": [STORAGE_SQLITE, STORAGE_FIREBASE]}),
+        'mo_firebase_mirror': OptionInfo(False, 'Keep local copy of Firebase records (requires restart)'),
         'mo_download_preview': OptionInfo(True, 'Download Preview'),
+        'mo_download_concurrency': OptionInfo(DEFAULT_DOWNLOAD_CONCURRENCY,
+                                              f'Parallel downloads ({DEFAULT_DOWNLOAD_CONCURRENCY} default value):'),
+        'mo_download_host_concurrency': OptionInfo(DEFAULT_DOWNLOAD_HOST_CONCURRENCY,
+                                                   f'Parallel downloads per host '
+                                                   f'({DEFAULT_DOWNLOAD_HOST_CONCURRENCY} default value):'),
+        'mo_download_segments': OptionInfo(DEFAULT_DOWNLOAD_SEGMENTS,
+                                           f'Connections per file, 1 disables segmented downloads '
+                                           f'({DEFAULT_DOWNLOAD_SEGMENTS} default value):'),
     }
 
     dir_opts = {
@@ -150,6 +176,8 @@ def on_ui_tabs():
 
 def on_app_started(demo: Optional[Blocks], app: FastAPI):
     init_extension_api(app)
+    start_files_state_tracking()
+    ThumbnailWarmer.instance().start(DownloadManager.instance().is_running)
 
 
 script_callbacks.on_ui_settings(on_ui_settings)